@@ -5,6 +5,11 @@ import datetime
 from aiohttp import web
 from dotenv import load_dotenv
 
+try:
+    import uvloop  # Optional: libuv-backed event loop for the streaming server
+except ImportError:
+    uvloop = None
+
 # --- Load .env file BEFORE importing config ---
 load_dotenv()
 logger = logging.getLogger(__name__) 
@@ -53,7 +58,11 @@ async def main():
     logger.info("Starting Telegram Download Link Generator Bot...")
     
     # Initialize security components
-    initialize_rate_limiters(Var.MAX_LINKS_PER_DAY)
+    initialize_rate_limiters(
+        Var.MAX_LINKS_PER_DAY,
+        max_streams_per_ip=Var.STREAM_MAX_PER_IP,
+        stream_bytes_per_second=Var.STREAM_RATE_LIMIT_KBPS * 1024,
+    )
     
     # Log initial memory usage
     memory_manager.log_memory_usage("startup")
@@ -192,6 +201,10 @@ async def perform_shutdown(web_runner_to_stop, client_manager_to_stop, cleanup_s
 
 
 if __name__ == "__main__":
+     # Installed before the loop is created so pyrogram and aiohttp share it
+     if uvloop is not None:
+         asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+         logger.info("Using uvloop event loop.")
      loop = asyncio.get_event_loop()
      main_task = None
      try:
@@ -1,4 +1,5 @@
 # StreamBot/client_manager.py
+import time
 import asyncio
 import logging
 from typing import List, Optional, Dict
@@ -46,6 +47,8 @@ class ClientManager:
 
         self._round_robin_index = 0
         self._lock = asyncio.Lock()
+        # Short-lived cache of the connected client count (value, monotonic ts)
+        self._connected_count_cache = (0, 0.0)
         logger.info("ClientManager initialized.")
         logger.info(f"Primary bot token: ***{primary_bot_token[-4:]}")
         logger.info(f"Found {len(additional_tokens_list)} additional bot tokens.")
@@ -154,6 +157,17 @@ class ClientManager:
         self.worker_clients.clear()
         self.streamers.clear()
         self.primary_client = None
+        self._connected_count_cache = (0, 0.0)
+
+    @property
+    def connected_clients(self) -> int:
+        """Number of connected clients, recounted at most every 2 seconds."""
+        count, counted_at = self._connected_count_cache
+        now = time.monotonic()
+        if now - counted_at >= 2.0:
+            count = sum(1 for client in self.all_clients if client.is_connected)
+            self._connected_count_cache = (count, now)
+        return count
 
     def get_primary_client(self) -> Optional[Client]:
         """Get the primary client if available and connected."""
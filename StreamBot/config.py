@@ -111,7 +111,17 @@ class Var:
     # Rate and bandwidth limiting
     MAX_LINKS_PER_DAY = get_env("MAX_LINKS_PER_DAY", default=5, is_int=True)
     BANDWIDTH_LIMIT_GB = get_env("BANDWIDTH_LIMIT_GB", default=100, is_int=True)
+    STREAM_MAX_PER_IP = get_env("STREAM_MAX_PER_IP", default=4, is_int=True)
+    STREAM_RATE_LIMIT_KBPS = get_env("STREAM_RATE_LIMIT_KBPS", default=0, is_int=True)
+    STREAM_PART_CACHE_MB = get_env("STREAM_PART_CACHE_MB", default=64, is_int=True)
     
+    # Health endpoint tuning
+    HEALTH_CACHE_TTL = get_env("HEALTH_CACHE_TTL", default=5, is_int=True)
+    DB_HEALTH_INTERVAL = get_env("DB_HEALTH_INTERVAL", default=10, is_int=True)
+
+    # Shared session token store (optional; tokens are kept in memory without it)
+    REDIS_URL = get_env("REDIS_URL", default="")
+
     # Session generator access control
     ALLOW_USER_LOGIN = get_env("ALLOW_USER_LOGIN", default=False, is_bool=True)
     
@@ -159,16 +169,17 @@ class Var:
     # List of user IDs who are allowed to use admin commands like /broadcast
     # Separate multiple IDs with spaces in the environment variable
     # Example: ADMINS="12345678 98765432"
+    # Stored as a frozenset: admin checks run on every command/auth action.
     _admin_str = get_env("ADMINS", default="")
     try:
-        ADMINS = [int(admin_id.strip()) for admin_id in _admin_str.split() if admin_id.strip()]
+        ADMINS = frozenset(int(admin_id) for admin_id in _admin_str.split())
         if ADMINS:
-            logger.info(f"Admin user IDs loaded: {ADMINS}")
+            logger.info(f"Admin user IDs loaded: {sorted(ADMINS)}")
         else:
             logger.warning("No ADMINS specified in environment variables. Broadcast command will not work.")
     except ValueError:
         logger.error(f"Invalid ADMINS value '{_admin_str}'. Ensure it's a space-separated list of numbers.")
-        ADMINS = [] # Set to empty list on error
+        ADMINS = frozenset() # Set to empty set on error
 
     # --- Broadcast Messages ---
     BROADCAST_REPLY_PROMPT = "Reply to the message you want to broadcast with the `/broadcast` command."
@@ -9,7 +9,7 @@ This module provides consolidated security components including:
 - Bandwidth monitoring and limiting
 """
 
-from .rate_limiter import WebRateLimiter, BotRateLimiter, InvalidRequestGuard
+from .rate_limiter import WebRateLimiter, BotRateLimiter, InvalidRequestGuard, StreamThrottle
 from .middleware import SecurityMiddleware
 from .validator import RequestValidator
 
@@ -17,6 +17,7 @@ __all__ = [
     "WebRateLimiter",
     "BotRateLimiter", 
     "InvalidRequestGuard",
+    "StreamThrottle",
     "SecurityMiddleware",
     "RequestValidator"
 ] 
\ No newline at end of file
@@ -200,17 +200,76 @@ class BotRateLimiter:
             return count, wait_time_seconds
 
 
+class StreamThrottle:
+    """Per-IP cap on concurrent streams with an optional bytes/sec token bucket.
+
+    Streams over the cap are refused up front instead of competing for the
+    shared Telegram clients and pushing them into FloodWait.
+    """
+
+    def __init__(self, max_streams_per_ip: int = 4, bytes_per_second: int = 0):
+        self.max_streams_per_ip = max_streams_per_ip
+        self.bytes_per_second = bytes_per_second
+        self._active: Dict[str, int] = {}
+        self._buckets: Dict[str, list] = {}  # ip -> [tokens, last_refill]
+
+    def try_acquire(self, ip: str) -> bool:
+        """Reserve a stream slot for ip; False if it is already at the cap."""
+        active = self._active.get(ip, 0)
+        if self.max_streams_per_ip > 0 and active >= self.max_streams_per_ip:
+            return False
+        self._active[ip] = active + 1
+        return True
+
+    def release(self, ip: str) -> None:
+        """Free a stream slot; the IP's bucket is dropped with its last stream."""
+        active = self._active.get(ip, 0) - 1
+        if active > 0:
+            self._active[ip] = active
+        else:
+            self._active.pop(ip, None)
+            self._buckets.pop(ip, None)
+
+    async def consume(self, ip: str, nbytes: int) -> None:
+        """Wait until ip may send nbytes more; no-op when the byte rate is unlimited."""
+        rate = self.bytes_per_second
+        if rate <= 0:
+            return
+        now = time.monotonic()
+        bucket = self._buckets.get(ip)
+        if bucket is None:
+            bucket = self._buckets[ip] = [float(rate), now]
+        # Refill up to one second of burst, then go into debt for this write
+        tokens = min(float(rate), bucket[0] + (now - bucket[1]) * rate) - nbytes
+        bucket[0] = tokens
+        bucket[1] = now
+        if tokens < 0:
+            await asyncio.sleep(-tokens / rate)
+
+    def retry_headers(self) -> Dict[str, str]:
+        """RateLimit headers for a refused stream."""
+        return {
+            'RateLimit-Limit': str(self.max_streams_per_ip),
+            'RateLimit-Remaining': '0',
+            'Retry-After': '5',
+        }
+
+
 # Global instances - initialized with default values from config
 web_rate_limiter = WebRateLimiter()
 bot_rate_limiter = BotRateLimiter()
 invalid_request_guard = InvalidRequestGuard()
+stream_throttle = StreamThrottle()
 
 # Function to initialize with config values
-def initialize_rate_limiters(max_links_per_day: int):
+def initialize_rate_limiters(max_links_per_day: int, max_streams_per_ip: int = 4, stream_bytes_per_second: int = 0):
     """Initialize rate limiters with config values."""
     global bot_rate_limiter
     bot_rate_limiter = BotRateLimiter(max_links_per_day)
-    logger.info(f"Rate limiters initialized with max_links_per_day={max_links_per_day}")
+    # Configured in place: the streaming module holds a reference to this instance
+    stream_throttle.max_streams_per_ip = max_streams_per_ip
+    stream_throttle.bytes_per_second = stream_bytes_per_second
+    logger.info(f"Rate limiters initialized with max_links_per_day={max_links_per_day}, max_streams_per_ip={max_streams_per_ip}")
 
 # Cleanup function for scheduler - consolidated cleanup
 async def cleanup_rate_limiters():
@@ -13,6 +13,8 @@ class TelegramAuth:
     
     def __init__(self):
         self.bot_token = Var.BOT_TOKEN
+        # The widget HMAC key depends only on the bot token, so derive it once
+        self._secret_key = hashlib.sha256(self.bot_token.encode('utf-8')).digest()
         
     def verify_telegram_auth(self, auth_data: Dict[str, Any]) -> bool:
         """
@@ -59,12 +61,9 @@ class TelegramAuth:
             
             data_check_string = '\n'.join(data_check_arr)
             
-            # Create secret key from bot token
-            secret_key = hashlib.sha256(self.bot_token.encode('utf-8')).digest()
-            
             # Calculate expected hash
             expected_hash = hmac.new(
-                secret_key,
+                self._secret_key,
                 data_check_string.encode('utf-8'),
                 hashlib.sha256
             ).hexdigest()
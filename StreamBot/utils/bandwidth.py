@@ -1,4 +1,5 @@
 # StreamBot/utils/bandwidth.py
+import asyncio
 import logging
 import datetime
 from typing import Optional
@@ -9,6 +10,10 @@ logger = logging.getLogger(__name__)
 # Global variable to cache database connection
 _bandwidth_collection = None
 
+# Bytes served but not yet written to MongoDB; flushed as one $inc
+BANDWIDTH_FLUSH_INTERVAL = 5  # seconds
+_pending_bytes = 0
+
 def get_bandwidth_collection():
     """Get or create the bandwidth collection reference."""
     global _bandwidth_collection
@@ -91,16 +96,45 @@ async def add_bandwidth_usage(bytes_count: int) -> bool:
         logger.error(f"Error adding bandwidth usage: {e}")
         return False
 
+def record_bandwidth_usage(bytes_count: int) -> None:
+    """Queue served bytes for the next batched flush to MongoDB."""
+    global _pending_bytes
+    if bytes_count > 0:
+        _pending_bytes += bytes_count
+
+async def flush_bandwidth_usage() -> bool:
+    """Write queued bandwidth usage in a single update; kept queued on failure."""
+    global _pending_bytes
+    pending, _pending_bytes = _pending_bytes, 0
+    if pending <= 0:
+        return True
+    if await add_bandwidth_usage(pending):
+        return True
+    _pending_bytes += pending
+    return False
+
+async def bandwidth_flush_loop(interval: float = BANDWIDTH_FLUSH_INTERVAL):
+    """Flush queued bandwidth usage every `interval` seconds until cancelled."""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            await flush_bandwidth_usage()
+    except asyncio.CancelledError:
+        await flush_bandwidth_usage()
+        raise
+
 async def is_bandwidth_limit_exceeded() -> bool:
     """Check if current bandwidth usage exceeds the configured limit."""
     if Var.BANDWIDTH_LIMIT_GB <= 0:
         return False  # No limit configured
     
     usage = await get_current_bandwidth_usage()
-    limit_exceeded = usage["gb_used"] >= Var.BANDWIDTH_LIMIT_GB
+    # Include bytes still waiting for the next flush
+    gb_used = (usage["bytes_used"] + _pending_bytes) / (1024**3)
+    limit_exceeded = gb_used >= Var.BANDWIDTH_LIMIT_GB
     
     if limit_exceeded:
-        logger.warning(f"Bandwidth limit exceeded: {usage['gb_used']:.3f} GB >= {Var.BANDWIDTH_LIMIT_GB} GB")
+        logger.warning(f"Bandwidth limit exceeded: {gb_used:.3f} GB >= {Var.BANDWIDTH_LIMIT_GB} GB")
     
     return limit_exceeded
 
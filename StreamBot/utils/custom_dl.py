@@ -4,7 +4,7 @@ import logging
 from StreamBot.config import Var
 from typing import Dict, Union, AsyncGenerator
 from pyrogram import Client, utils, raw
-from .file_properties import get_file_ids
+from .file_properties import get_file_ids, file_ids_from_message
 from pyrogram.session import Session, Auth
 from pyrogram.errors import AuthBytesInvalid
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
@@ -31,14 +31,22 @@ class ByteStreamer:
         self.cached_file_ids: Dict[int, FileId] = {}
         asyncio.create_task(self.clean_cache())
 
-    async def get_file_properties(self, message_id: int) -> FileId:
+    async def get_file_properties(self, message_id: int, message=None) -> FileId:
         """
         Returns the properties of a media of a specific message in a FileId class.
         if the properties are cached, then it'll return the cached results.
         or it'll generate the properties from the Message ID and cache them.
+        If the caller already fetched the message it is parsed directly,
+        saving the get_messages round trip.
         """
         if message_id not in self.cached_file_ids:
-            await self.generate_file_properties(message_id)
+            if message is not None and not message.empty:
+                file_id = await file_ids_from_message(message)
+                if not file_id:
+                    raise FileNotFoundError(f"Message {message_id} has no media")
+                self.cached_file_ids[message_id] = file_id
+            else:
+                await self.generate_file_properties(message_id)
             logger.debug(f"Cached file properties for message with ID {message_id}")
         return self.cached_file_ids[message_id]
     
@@ -165,9 +173,10 @@ class ByteStreamer:
         last_part_cut: int,
         part_count: int,
         chunk_size: int,
-    ) -> AsyncGenerator[bytes, None]:
+    ) -> AsyncGenerator[Union[bytes, memoryview], None]:
         """
         Custom generator that yields the bytes of the media file.
+        Trimmed first/last parts are yielded as memoryview slices.
         Modified from WebStreamer implementation to fix offset errors.
         """
         client = self.client
@@ -188,12 +197,13 @@ class ByteStreamer:
                     chunk = r.bytes
                     if not chunk:
                         break
+                    # Edge parts are trimmed via memoryview to avoid copying the part
                     elif part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
+                        yield memoryview(chunk)[first_part_cut:last_part_cut]
                     elif current_part == 1:
-                        yield chunk[first_part_cut:]
+                        yield memoryview(chunk)[first_part_cut:]
                     elif current_part == part_count:
-                        yield chunk[:last_part_cut]
+                        yield memoryview(chunk)[:last_part_cut]
                     else:
                         yield chunk
 
@@ -19,6 +19,10 @@ async def get_file_ids(client: Client, chat_id: int, message_id: int) -> Optiona
     message = await client.get_messages(chat_id, message_id)
     if message.empty:
         raise FileNotFoundError(f"Message {message_id} not found")
+    return await file_ids_from_message(message)
+
+async def file_ids_from_message(message: "Message") -> Optional[FileId]:
+    """Build the FileId for an already fetched message without another RPC."""
     media = get_media_from_message(message)
     file_unique_id = await parse_file_unique_id(message)
     file_id = await parse_file_id(message)
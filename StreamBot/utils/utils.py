@@ -1,3 +1,4 @@
+import re
 import mimetypes
 from pyrogram.types import Message, Audio, Document, Photo, Video, Animation, Sticker, Voice
 from pyrogram import Client
@@ -12,10 +13,10 @@ import logging
 logger = logging.getLogger(__name__)
 
 # Shared video MIME types for consistency across the application
-VIDEO_MIME_TYPES = {
+VIDEO_MIME_TYPES = frozenset({
     'video/mp4', 'video/webm', 'video/ogg', 'video/quicktime',
     'video/x-msvideo', 'video/x-matroska', 'video/avi', 'video/mkv'
-}
+})
 
 def humanbytes(size: int) -> str:
     """Convert bytes to human-readable format."""
@@ -216,7 +217,19 @@ def encode_message_id(message_id) -> str:
         logger.error(f"Error encoding message ID {message_id}: {e}", exc_info=True)
         return str(message_id)
 
-def decode_message_id(encoded_id_str: str) -> int | str | None:
+# base64url alphabet accepted in /dl and /stream links; compiled once at import
+_ENCODED_ID_RE = re.compile(r'[A-Za-z0-9_-]+')
+
+
+class UserSessionRef(str):
+    """Virtual ``user_...`` message ID of a file served through a user session.
+
+    Subclasses str so it still keys ``user_session_files`` and formats in logs
+    unchanged; routes tell it apart from log channel IDs with one isinstance check.
+    """
+    __slots__ = ()
+
+def decode_message_id(encoded_id_str: str) -> int | UserSessionRef | None:
     """Decode an encoded ID string back to a message ID."""
     try:
         # Input validation
@@ -230,9 +243,7 @@ def decode_message_id(encoded_id_str: str) -> int | str | None:
             return None
         
         # Basic character validation for base64url
-        import string
-        valid_chars = string.ascii_letters + string.digits + '-_'
-        if not all(c in valid_chars for c in encoded_id_str):
+        if not _ENCODED_ID_RE.fullmatch(encoded_id_str):
             logger.warning(f"Invalid characters in encoded ID: {encoded_id_str[:50]}...")
             return None
         
@@ -243,7 +254,7 @@ def decode_message_id(encoded_id_str: str) -> int | str | None:
 
         # Check if this is a virtual user session file ID
         if decoded_str.startswith('user_'):
-            return decoded_str  # Return the virtual message ID string
+            return UserSessionRef(decoded_str)  # Return the virtual message ID
         
         # Handle regular integer message IDs
         try:
@@ -1,6 +1,21 @@
 import datetime
 from aiohttp import web
 
+# Cookies are marked Secure when the public URL is HTTPS; BASE_URL is fixed
+# for the process lifetime, so this is decided once at import
+try:
+    from StreamBot.config import Var
+    COOKIE_SECURE = str(Var.BASE_URL).lower().startswith('https://')
+except Exception:
+    COOKIE_SECURE = False
+
+
+def _cookie_attrs(max_age_seconds: int) -> str:
+    return f"; HttpOnly; Max-Age={max_age_seconds}; Path=/; SameSite=Lax" + ("; Secure" if COOKIE_SECURE else "")
+
+
+_DEFAULT_COOKIE_ATTRS = _cookie_attrs(3600)
+
 
 def set_auth_cookies(response: web.StreamResponse, session_token: str, user_id: int, max_age_seconds: int = 3600) -> None:
     """Set authentication cookies on the response.
@@ -9,24 +24,16 @@ def set_auth_cookies(response: web.StreamResponse, session_token: str, user_id:
     - session_token: opaque token used by server to validate session
     - is_authenticated: string 'true' flag recorded alongside the session
     - user_id: user identifier (non-sensitive) stored for diagnostics
+
+    The Set-Cookie headers are written directly rather than through
+    response.set_cookie: every value is URL-safe (token_urlsafe tokens and
+    integer IDs), so the Morsel quoting/rendering would be wasted work.
     """
-    is_secure = False
-    try:
-        from StreamBot.config import Var
-        is_secure = str(Var.BASE_URL).lower().startswith('https://')
-    except Exception:
-        is_secure = False
-
-    cookie_kwargs = {
-        'httponly': True,
-        'secure': is_secure,
-        'max_age': max_age_seconds,
-        'samesite': 'Lax'
-    }
-
-    response.set_cookie('session_token', session_token, **cookie_kwargs)
-    response.set_cookie('is_authenticated', 'true', **cookie_kwargs)
-    response.set_cookie('user_id', str(user_id), **cookie_kwargs)
+    attrs = _DEFAULT_COOKIE_ATTRS if max_age_seconds == 3600 else _cookie_attrs(max_age_seconds)
+    headers = response.headers
+    headers.add('Set-Cookie', f'session_token={session_token}{attrs}')
+    headers.add('Set-Cookie', f'is_authenticated=true{attrs}')
+    headers.add('Set-Cookie', f'user_id={user_id}{attrs}')
 
 
 def clear_auth_cookies(response: web.StreamResponse) -> None:
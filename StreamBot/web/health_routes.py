@@ -6,46 +6,129 @@ FIXED: Removed explicit @routes.head decorators and the redundant @routes.get("/
 Routes remaining: /health, /ping, /status, /
 """
 
+import json
+import time
+import string
+import asyncio
 import logging
 import datetime
+from collections import deque
 from aiohttp import web
+from multidict import CIMultiDict
 from pyrogram import Client
 
+try:
+    import orjson
+except ImportError:  # Optional fast path; the stdlib encoder is used otherwise
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# Pre-bound for the hot handlers below (saves attribute lookups per call)
+_utcnow = datetime.datetime.now
+_UTC = datetime.timezone.utc
+
 # Import Var config
 try:
     from StreamBot.config import Var
 except ImportError:
     Var = None
 
+try:
+    from StreamBot.utils.stream_cleanup import stream_tracker
+except ImportError:
+    stream_tracker = None
+
+try:
+    from StreamBot.database.database import dbclient
+except ImportError:
+    dbclient = None
+
 routes = web.RouteTableDef()
 
+# Headers shared by every JSON health response; copied per response so only
+# Content-Length has to be filled in.
+_JSON_HEADERS = CIMultiDict({
+    "Content-Type": "application/json; charset=utf-8",
+    "Cache-Control": "no-store",
+})
+
+
+# Last /health payload; reused until it is older than HEALTH_CACHE_TTL, and
+# served with a "stale" marker for a while longer if building a fresh one fails.
+_HEALTH_CACHE = {"ts": 0.0, "stale_until": 0.0, "body": None, "status": 200}
+_HEALTH_CACHE_TTL = getattr(Var, 'HEALTH_CACHE_TTL', 5) if Var else 5
+_HEALTH_STALE_SECONDS = 60
+
+# MongoDB reachability, refreshed by a background poller so /health never
+# blocks the event loop on a synchronous ping.
+_db_health = {"status": "unknown", "latency_ms": None, "latency_p99_ms": None}
+_DB_HEALTH_INTERVAL = getattr(Var, 'DB_HEALTH_INTERVAL', 10) if Var else 10
+_DB_PING_TIMEOUT = 1.0
+_DB_SLOW_PING_MS = 100
+_db_latencies = deque(maxlen=100)
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps(data) -> bytes:
+    """Serialize to JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, default=_json_default).encode("utf-8")
+
+
+def _json_response(data: dict, status: int = 200) -> web.Response:
+    """Build a JSON response from the preconfigured header template."""
+    body = _dumps(data)
+    headers = _JSON_HEADERS.copy()
+    headers["Content-Length"] = str(len(body))
+    return web.Response(body=body, status=status, headers=headers)
 
-def format_uptime(start_time_dt: datetime.datetime) -> str:
-    """Format the uptime into a human-readable string."""
+
+# Last (start_time, days, seconds) -> string result; HEAD and GET polls tend
+# to arrive within the same second.
+_UPTIME_CACHE = [None, ""]
+
+
+def format_uptime(start_time_dt: datetime.datetime, now: datetime.datetime | None = None) -> str:
+    """Format the uptime into a human-readable string.
+
+    Handlers that already captured the current UTC time can pass it as ``now``.
+    """
     if start_time_dt is None:
         return "N/A"
     
     # Ensure start_time_dt is timezone-aware (UTC)
     if start_time_dt.tzinfo is None:
-        start_time_dt = start_time_dt.replace(tzinfo=datetime.timezone.utc)
+        start_time_dt = start_time_dt.replace(tzinfo=_UTC)
         
-    now = datetime.datetime.now(datetime.timezone.utc)
+    if now is None:
+        now = _utcnow(_UTC)
     delta = now - start_time_dt
+    key = (start_time_dt, delta.days, delta.seconds)
+    if _UPTIME_CACHE[0] == key:
+        return _UPTIME_CACHE[1]
+
     days = delta.days
     hours, rem = divmod(delta.seconds, 3600)
     minutes, seconds = divmod(rem, 60)
 
-    uptime_str = ""
+    parts = []
     if days > 0:
-        uptime_str += f"{days}d "
-    if hours > 0:
-        uptime_str += f"{hours}h "
-    if minutes > 0:
-        uptime_str += f"{minutes}m "
-    uptime_str += f"{seconds}s"
-    return uptime_str.strip() if uptime_str else "0s"
+        parts.append(f"{days}d")
+    if hours:
+        parts.append(f"{hours}h")
+    if minutes:
+        parts.append(f"{minutes}m")
+    parts.append(f"{seconds}s")
+    uptime_str = " ".join(parts)
+    _UPTIME_CACHE[:] = [key, uptime_str]
+    return uptime_str
 
 
 # --- CSS STYLES --- (Retained for status page aesthetic)
@@ -155,15 +238,148 @@ PAGE_STYLE = """
     }
 """
 
+
+# Status page shell, built once at import; only the dynamic fields are
+# substituted per request.
+_STATUS_HTML_TEMPLATE = string.Template(f"""
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Stream Bot Panel</title>
+    <style>
+        {PAGE_STYLE}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>Telegram Stream Generator</h1>
+            <div class="status-badge $status_class">
+                ● $status_text
+            </div>
+        </div>
+
+        <div class="grid">
+            <div class="card">
+                <div class="card-label">Bot Identity</div>
+                <div class="card-value">@$bot_username</div>
+            </div>
+            
+            <div class="card">
+                <div class="card-label">System Uptime</div>
+                <div class="card-value">$uptime_str</div>
+            </div>
+            
+            <div class="card">
+                <div class="card-label">Active Streams</div>
+                <div class="card-value">$active_streams</div>
+            </div>
+            
+            <div class="card">
+                <div class="card-label">Server Time (UTC)</div>
+                <div class="card-value">$now_utc</div>
+            </div>
+        </div>
+
+        <div class="footer">
+            <p>Dashboard auto-refreshes every 30s</p>
+            <a href="/health">Health Check</a> • 
+            <a href="/api/info">API Info</a>
+        </div>
+    </div>
+    <script>
+        setTimeout(() => window.location.reload(), 30000);
+    </script>
+</body>
+</html>
+        """)
+
+
+def _discard_ping_result(future: asyncio.Future):
+    # A ping that outlived its timeout may still fail; mark the error retrieved
+    if not future.cancelled():
+        future.exception()
+
+
+async def _db_health_poller(app: web.Application):
+    """Ping MongoDB periodically off the request path and record the result."""
+    if dbclient is None:
+        logger.error("DB health poller disabled, database client is not available")
+        _db_health["status"] = "unavailable"
+        return
+
+    loop = asyncio.get_running_loop()
+    ping = None
+    while True:
+        if ping is not None and not ping.done():
+            # Timing out only stops waiting: the executor thread stays blocked
+            # until pymongo gives up, so never start a second ping beside it.
+            logger.warning("MongoDB health ping from the previous poll still pending, skipping")
+            await asyncio.sleep(_DB_HEALTH_INTERVAL)
+            continue
+        started = time.monotonic()
+        ping = loop.run_in_executor(None, dbclient.admin.command, 'ping')
+        ping.add_done_callback(_discard_ping_result)
+        try:
+            await asyncio.wait_for(asyncio.shield(ping), timeout=_DB_PING_TIMEOUT)
+            finished = time.monotonic()
+            latency_ms = round((finished - started) * 1000, 2)
+            _db_latencies.append(latency_ms)
+            ordered = sorted(_db_latencies)
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            if latency_ms > _DB_SLOW_PING_MS:
+                logger.warning(f"MongoDB health ping slow: {latency_ms}ms (p99 over last {len(ordered)}: {p99}ms)")
+            _db_health.update(
+                status="connected",
+                latency_ms=latency_ms,
+                latency_p99_ms=p99,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"MongoDB health ping exceeded {_DB_PING_TIMEOUT}s budget")
+            _db_health.update(status="slow", latency_ms=None)
+        except Exception as e:
+            logger.warning(f"MongoDB health ping failed: {e}")
+            _db_health.update(status="disconnected", latency_ms=None)
+        await asyncio.sleep(_DB_HEALTH_INTERVAL)
+
+
+async def _start_db_health_poller(app: web.Application):
+    app['db_health_task'] = asyncio.create_task(_db_health_poller(app))
+
+
+async def _stop_db_health_poller(app: web.Application):
+    task = app.get('db_health_task')
+    if task and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def setup_health_checks(app: web.Application):
+    """Register the background DB health poller on the web app lifecycle."""
+    app.on_startup.append(_start_db_health_poller)
+    app.on_cleanup.append(_stop_db_health_poller)
+
+
 @routes.get("/health")
 async def health_check_route(request: web.Request):
     """
     Simple health check endpoint for /health.
     (The HEAD method is handled automatically by aiohttp)
     """
+    now = time.monotonic()
+    if _HEALTH_CACHE["body"] is not None and now - _HEALTH_CACHE["ts"] < _HEALTH_CACHE_TTL:
+        return _json_response(_HEALTH_CACHE["body"], status=_HEALTH_CACHE["status"])
+
     try:
         start_time = request.app.get('start_time') or request.app.get('bot_start_time')
         bot_client: Client = request.app.get('bot_client')
+        client_manager = request.app.get('client_manager')
+        now_utc = _utcnow(_UTC)
         
         status_code = 200
         status_msg = "healthy"
@@ -171,27 +387,58 @@ async def health_check_route(request: web.Request):
         
         if bot_client and bot_client.is_connected:
             bot_connected = True
+            if _db_health["status"] in ("slow", "disconnected"):
+                status_msg = "degraded"
         else:
             status_code = 503
             status_msg = "unhealthy"
 
         response_data = {
             "status": status_msg,
-            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-            "uptime": format_uptime(start_time),
-            "bot_connected": bot_connected
+            "timestamp": now_utc,
+            "uptime": format_uptime(start_time, now_utc),
+            "bot_connected": bot_connected,
+            "connected_clients": client_manager.connected_clients if client_manager else 0,
+            "database_status": _db_health["status"],
+            "database_latency_ms": _db_health["latency_ms"],
+            "database_latency_p99_ms": _db_health["latency_p99_ms"]
         }
-        return web.json_response(response_data, status=status_code)
+        _HEALTH_CACHE.update(
+            ts=now,
+            stale_until=now + _HEALTH_CACHE_TTL + _HEALTH_STALE_SECONDS,
+            body=response_data,
+            status=status_code,
+        )
+        return _json_response(response_data, status=status_code)
         
     except Exception as e:
         logger.error(f"Health check error: {e}")
-        return web.json_response({"status": "error", "message": str(e)}, status=500)
+        # Fall back to the last good payload rather than flapping monitors
+        if _HEALTH_CACHE["body"] is not None and now < _HEALTH_CACHE["stale_until"]:
+            return _json_response({**_HEALTH_CACHE["body"], "stale": True}, status=_HEALTH_CACHE["status"])
+        return _json_response({"status": "error", "message": str(e)}, status=500)
+
+
+# Pre-serialized /ping body; the timestamp is refreshed at most once a second.
+_PING_BODY = {"ts": float("-inf"), "v": b""}
+
+
+def _ping_body() -> bytes:
+    now = time.monotonic()
+    if now - _PING_BODY["ts"] >= 1.0:
+        _PING_BODY["v"] = _dumps({
+            "status": "ok",
+            "timestamp": _utcnow(_UTC).isoformat(timespec='seconds'),
+            "message": "pong"
+        })
+        _PING_BODY["ts"] = now
+    return _PING_BODY["v"]
 
 
 @routes.get("/ping")
 async def ping_route(request: web.Request):
     """Simple ping. (HEAD is handled automatically by aiohttp)"""
-    return web.json_response({"status": "ok", "message": "pong"})
+    return web.Response(body=_ping_body(), content_type='application/json')
 
 
 @routes.get("/status")
@@ -203,81 +450,35 @@ async def status_route(request: web.Request):
     try:
         bot_client: Client = request.app.get('bot_client')
         start_time = request.app.get('start_time') or request.app.get('bot_start_time')
+        now_utc = _utcnow(_UTC)
         
         # Determine Status
         if bot_client and bot_client.is_connected:
             status_text = "SYSTEM ONLINE"
             status_class = ""
-            bot_username = getattr(bot_client.me, 'username', 'Unknown') if hasattr(bot_client, 'me') else 'Unknown'
+            bot_me = request.app.get('bot_me')
+            bot_username = bot_me.username if bot_me else 'Unknown'
         else:
             status_text = "SYSTEM OFFLINE"
             status_class = "offline"
             bot_username = "N/A"
         
-        uptime_str = format_uptime(start_time) if start_time else "Unknown"
+        uptime_str = format_uptime(start_time, now_utc) if start_time else "Unknown"
         
         # Get active streams safely
         try:
-            from StreamBot.utils.stream_cleanup import stream_tracker
-            active_streams = str(stream_tracker.get_active_count())
+            active_streams = str(stream_tracker.get_active_count()) if stream_tracker else "0"
         except Exception:
             active_streams = "0"
 
-        # Generate HTML
-        html_content = f"""
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Stream Bot Panel</title>
-    <style>
-        {PAGE_STYLE}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>Telegram Stream Generator</h1>
-            <div class="status-badge {status_class}">
-                ● {status_text}
-            </div>
-        </div>
-
-        <div class="grid">
-            <div class="card">
-                <div class="card-label">Bot Identity</div>
-                <div class="card-value">@{bot_username}</div>
-            </div>
-            
-            <div class="card">
-                <div class="card-label">System Uptime</div>
-                <div class="card-value">{uptime_str}</div>
-            </div>
-            
-            <div class="card">
-                <div class="card-label">Active Streams</div>
-                <div class="card-value">{active_streams}</div>
-            </div>
-            
-            <div class="card">
-                <div class="card-label">Server Time (UTC)</div>
-                <div class="card-value">{datetime.datetime.now(datetime.timezone.utc).strftime('%H:%M:%S')}</div>
-            </div>
-        </div>
-
-        <div class="footer">
-            <p>Dashboard auto-refreshes every 30s</p>
-            <a href="/health">Health Check</a> • 
-            <a href="/api/info">API Info</a>
-        </div>
-    </div>
-    <script>
-        setTimeout(() => window.location.reload(), 30000);
-    </script>
-</body>
-</html>
-        """
+        html_content = _STATUS_HTML_TEMPLATE.substitute(
+            status_class=status_class,
+            status_text=status_text,
+            bot_username=bot_username,
+            uptime_str=uptime_str,
+            active_streams=active_streams,
+            now_utc=now_utc.strftime('%H:%M:%S'),
+        )
         
         return web.Response(text=html_content, content_type='text/html')
         
@@ -286,4 +487,4 @@ async def status_route(request: web.Request):
         return web.Response(text="Internal Server Error", status=500)
 
 
-__all__ = ['routes']
+__all__ = ['routes', 'setup_health_checks']
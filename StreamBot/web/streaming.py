@@ -1,16 +1,373 @@
+import time
+import socket
 import logging
 import asyncio
-import math
+from types import MappingProxyType
+from collections import OrderedDict
 from aiohttp import web
 from pyrogram.errors import FloodWait
 from StreamBot.config import Var
 from StreamBot.utils.utils import decode_message_id, get_file_attr, VIDEO_MIME_TYPES, get_media_message
-from StreamBot.utils.bandwidth import is_bandwidth_limit_exceeded, add_bandwidth_usage
+from StreamBot.utils.bandwidth import is_bandwidth_limit_exceeded, record_bandwidth_usage
 from StreamBot.utils.stream_cleanup import stream_tracker, tracked_stream_response
 from StreamBot.security.validator import validate_range_header, get_client_ip
+from StreamBot.security.rate_limiter import stream_throttle
 
 logger = logging.getLogger(__name__)
 
+# Pyrogram parts are buffered up to this size before each response.write.
+# Chunks arrive from MTProto in user space, so there is no file descriptor to
+# sendfile() from; teeing them through a pipe would only add a copy, and
+# coalesced writes remain the cheapest path to the socket.
+STREAM_FLUSH_BYTES = 4 * 1024 * 1024
+
+# Bytes between progress log lines on long streams
+STREAM_PROGRESS_LOG_BYTES = 10 * 1024 * 1024
+
+# message_id -> (cached_at, (media_msg, file_id, file_name, file_size, mime_type)).
+# Shared by /stream and /dl; entries are not limited to videos, so /stream
+# validates the MIME type on every request.
+_META_CACHE: dict = {}
+_META_TTL = 300
+_META_MAX = 1024
+
+# Telegram parts read ahead of the client while a write is in flight
+STREAM_PREFETCH_DEPTH = 4
+_PREFETCH_END = object()
+
+# Attempts after the first when stream_media fails with a non-FloodWait error
+STREAM_MAX_RETRIES = 2
+
+# A client write pending longer than this aborts the connection
+STREAM_WRITE_STALL_TIMEOUT = 30
+
+# LRU of Telegram parts keyed by (message_id, part_index). Only the first
+# parts and the last part of a video are kept: players fetch those (header,
+# MP4 moov atom) from every viewer before they start seeking.
+_PART_CACHE: "OrderedDict[tuple, bytes]" = OrderedDict()
+_PART_CACHE_MAX = max(0, getattr(Var, 'STREAM_PART_CACHE_MB', 64)) * 1024 * 1024
+_PART_CACHE_HEAD_PARTS = 2
+_part_cache_bytes = 0
+
+# RPC errors after which media_msg must be fetched again. A FloodWait
+# client switch keeps the message: it stays valid on the other bot clients.
+_STALE_MEDIA_ERRORS = frozenset({'FILE_REFERENCE_EXPIRED', 'FILE_REFERENCE_INVALID', 'MEDIA_INVALID'})
+
+# Kernel send buffer for stream sockets; holds a coalesced write without
+# waking the loop several times per flush
+STREAM_SNDBUF_BYTES = 2 * 1024 * 1024
+
+# Headers shared by every stream response; copied and completed per request.
+# Read-only so a handler can't mutate the template instead of its copy.
+_BASE_HEADERS = MappingProxyType({
+    'Accept-Ranges': 'bytes',
+    'Cache-Control': 'public, max-age=3600',  # Allow caching for better performance
+    'Connection': 'keep-alive',
+})
+
+# Bandwidth limit state is re-read from MongoDB at most once a second
+_BW_CACHE = {"ts": 0.0, "exceeded": False}
+
+
+def tune_stream_socket(request: web.Request) -> None:
+    """Enlarge the send buffer of a connection about to carry a large body.
+
+    aiohttp already enables TCP_NODELAY on accepted connections.
+    """
+    transport = request.transport
+    sock = transport.get_extra_info('socket') if transport is not None else None
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, STREAM_SNDBUF_BYTES)
+    except OSError as e:
+        logger.debug("Could not set SO_SNDBUF on stream socket: %s", e)
+
+
+async def _bandwidth_limit_exceeded() -> bool:
+    now = time.monotonic()
+    if now - _BW_CACHE["ts"] >= 1.0:
+        _BW_CACHE["exceeded"] = await is_bandwidth_limit_exceeded()
+        _BW_CACHE["ts"] = now
+    return _BW_CACHE["exceeded"]
+
+
+async def _prefetched(source, depth: int = STREAM_PREFETCH_DEPTH):
+    """Iterate an async iterator while a background task reads up to `depth` items ahead.
+
+    Errors raised by the source (e.g. FloodWait) are re-raised to the consumer.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+
+    async def fill():
+        # Every exit path queues a terminal item, otherwise the consumer would
+        # wait on queue.get() forever while holding its client and throttle slot.
+        end = _PREFETCH_END
+        try:
+            async for item in source:
+                await queue.put(item)
+        except asyncio.CancelledError as e:
+            if asyncio.current_task().cancelling():
+                raise  # Cancelled by the consumer, which is no longer reading
+            end = e
+        except BaseException as e:
+            end = e
+        finally:
+            # Close the source now rather than at garbage collection; _cached_parts
+            # closes pyrogram's generator in turn, stopping its GetFile reads.
+            try:
+                await source.aclose()
+            except BaseException as e:
+                if end is _PREFETCH_END:
+                    end = e
+        await queue.put(end)
+
+    producer = asyncio.create_task(fill())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _PREFETCH_END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # A TaskGroup cannot stay open across this generator's yields, so the
+        # producer is cancelled and awaited by hand on every exit path.
+        if not producer.done():
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+        # Only the producer's cancellation is swallowed, never our own (e.g.
+        # aiohttp cancelling the handler on client disconnect). Checked on
+        # every exit path so it does not matter whether the producer finished.
+        if asyncio.current_task().cancelling():
+            raise asyncio.CancelledError
+
+
+def get_cached_media_meta(message_id):
+    """Return cached (media_msg, file_id, file_name, file_size, mime_type) or None."""
+    entry = _META_CACHE.get(message_id)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] > _META_TTL:
+        _META_CACHE.pop(message_id, None)
+        return None
+    return entry[1]
+
+
+def cache_media_meta(message_id, meta: tuple):
+    if len(_META_CACHE) >= _META_MAX:
+        # dicts keep insertion order, so the first key is the oldest entry
+        _META_CACHE.pop(next(iter(_META_CACHE)), None)
+    _META_CACHE[message_id] = (time.monotonic(), meta)
+
+
+async def _fetch_stream_meta(streamer_client, message_id):
+    """Fetch the media message from Telegram and extract its file attributes."""
+    # Get media message with retry logic
+    max_msg_retries = 2
+    media_msg = None
+    for msg_retry in range(max_msg_retries):
+        try:
+            media_msg = await asyncio.wait_for(
+                get_media_message(streamer_client, message_id),
+                timeout=30
+            )
+            break
+        except asyncio.TimeoutError:
+            if msg_retry < max_msg_retries - 1:
+                logger.warning(f"Timeout getting message {message_id}, retry {msg_retry + 1}/{max_msg_retries}")
+                await asyncio.sleep(2)
+                continue
+            raise web.HTTPGatewayTimeout(text="Request timeout. Please try again.")
+        except (FloodWait, ConnectionError) as e:
+            # Only transient errors are worth a backoff; anything else (not found,
+            # expired, auth) is raised straight away to free the client slot.
+            if msg_retry < max_msg_retries - 1:
+                logger.warning(f"Error getting message {message_id}: {e}, retry {msg_retry + 1}/{max_msg_retries}")
+                await asyncio.sleep(2)
+                continue
+            raise
+
+    if not media_msg:
+        raise web.HTTPNotFound(text="File not found.")
+    
+    # Get file attributes
+    file_id, file_name, file_size, file_mime_type, file_unique_id = get_file_attr(media_msg)
+    
+    if not file_id:
+        raise web.HTTPNotFound(text="File not found or invalid.")
+
+    return media_msg, file_id, file_name, file_size, file_mime_type
+
+
+def _stream_headers(request: web.Request, meta: tuple, message_id):
+    """Build the response headers for a validated video; returns (status, headers, start, end)."""
+    media_msg, file_id, file_name, file_size, file_mime_type = meta
+
+    # Formatted once; reused by the headers and log lines below
+    file_size_str = str(file_size)
+    logger.info(f"Streaming video {file_name} ({file_size_str} bytes, {file_mime_type}) for {message_id}")
+
+    # Streaming-optimized headers
+    headers = _BASE_HEADERS.copy()
+    headers['Content-Type'] = file_mime_type
+    headers['Content-Disposition'] = f'inline; filename="{file_name}"'
+
+    # Handle range requests for video seeking
+    range_header = request.headers.get('Range')
+    status_code = 200
+    start_offset = 0
+    end_offset = file_size - 1
+
+    if range_header:
+        logger.debug("Video range request for %s: %s", message_id, range_header)
+        range_result = validate_range_header(range_header, file_size)
+        if range_result is None:
+            raise web.HTTPRequestRangeNotSatisfiable(
+                headers={'Content-Range': f'bytes */{file_size_str}'}
+            )
+        
+        start_offset, end_offset = range_result
+        
+        # Limit initial chunk size to prevent timeout on slow connections
+        requested_size = end_offset - start_offset + 1
+        max_initial_chunk = 10 * 1024 * 1024  # 10MB initial chunk
+        
+        if requested_size > max_initial_chunk and start_offset == 0:
+            # For initial requests, send smaller chunk
+            end_offset = start_offset + max_initial_chunk - 1
+            if end_offset >= file_size:
+                end_offset = file_size - 1
+            logger.debug("Limited initial chunk from %d to %d bytes", requested_size, end_offset - start_offset + 1)
+        
+        content_length = end_offset - start_offset + 1
+        headers['Content-Range'] = 'bytes %d-%d/%s' % (start_offset, end_offset, file_size_str)
+        headers['Content-Length'] = str(content_length)
+        status_code = 206
+        logger.info(f"Serving video range {start_offset}-{end_offset}/{file_size_str} ({content_length} bytes) for {message_id}")
+    else:
+        headers['Content-Length'] = file_size_str
+        logger.info(f"Serving full video {file_size_str} bytes for {message_id}")
+
+    return status_code, headers, start_offset, end_offset
+
+
+def _part_cache_get(key):
+    part = _PART_CACHE.get(key)
+    if part is not None:
+        _PART_CACHE.move_to_end(key)
+    return part
+
+
+def _part_cache_put(key, part: bytes):
+    global _part_cache_bytes
+    if key in _PART_CACHE or len(part) > _PART_CACHE_MAX:
+        return
+    _PART_CACHE[key] = part
+    _part_cache_bytes += len(part)
+    while _part_cache_bytes > _PART_CACHE_MAX:
+        _, evicted = _PART_CACHE.popitem(last=False)
+        _part_cache_bytes -= len(evicted)
+
+
+async def _cached_parts(client, media_msg, message_id, first_part: int, part_count: int, last_part: int):
+    """Yield parts first_part.. from the part cache, falling back to stream_media.
+
+    Leading parts that are cached never reach Telegram; the rest are streamed
+    and the head/tail parts among them are added to the cache.
+    """
+    index = first_part
+    end = first_part + part_count
+    while index < end:
+        part = _part_cache_get((message_id, index))
+        if part is None:
+            break
+        yield part
+        index += 1
+    if index >= end:
+        return
+
+    # Bound so it can be closed explicitly: leaving the async for (e.g. when this
+    # generator is closed early) does not aclose() the iterator it loops over.
+    upstream = client.stream_media(media_msg, offset=index, limit=end - index)
+    try:
+        async for part in upstream:
+            if _PART_CACHE_MAX and part and (index < _PART_CACHE_HEAD_PARTS or index == last_part):
+                _part_cache_put((message_id, index), bytes(part))
+            yield part
+            index += 1
+    finally:
+        await upstream.aclose()
+
+
+class _WriteWatchdog:
+    """Aborts the connection when a client write stalls.
+
+    Uses one timer per stream that is only re-armed when it fires, rather
+    than a wait_for task and timer per write. The handler task is never
+    cancelled: aborting the transport releases the pending write, and
+    `stalled` tells _write_buffer to stop the stream.
+    """
+
+    __slots__ = ('_transport', '_loop', '_timeout', '_since', '_handle', 'stalled', 'message_id')
+
+    def __init__(self, message_id, transport, timeout: float = STREAM_WRITE_STALL_TIMEOUT):
+        self._transport = transport
+        self._loop = asyncio.get_running_loop()
+        self._timeout = timeout
+        self._since = None
+        self._handle = None
+        self.stalled = False
+        self.message_id = message_id
+
+    def write_started(self):
+        self._since = self._loop.time()
+        if self._handle is None:
+            self._handle = self._loop.call_later(self._timeout, self._check)
+
+    def write_finished(self):
+        self._since = None
+
+    def _check(self):
+        self._handle = None
+        if self._since is None:
+            return  # No write pending; the next write re-arms the timer.
+        pending_for = self._loop.time() - self._since
+        if pending_for >= self._timeout:
+            logger.warning(f"Client write stalled for {pending_for:.0f}s on video stream {self.message_id}, aborting connection")
+            self.stalled = True
+            if self._transport is not None:
+                self._transport.abort()
+        else:
+            self._handle = self._loop.call_later(self._timeout - pending_for, self._check)
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+
+async def _write_buffer(response: web.StreamResponse, data: bytearray, watchdog: _WriteWatchdog, client_ip: str) -> bool:
+    """Write a coalesced buffer to the client; False if the stream should stop."""
+    try:
+        await stream_throttle.consume(client_ip, len(data))
+        watchdog.write_started()
+        await response.write(data)
+        watchdog.write_finished()
+    except (ConnectionResetError, BrokenPipeError):
+        logger.debug("Client disconnected during video stream %s", watchdog.message_id)
+        return False
+    except Exception as e:
+        logger.error(f"Error streaming chunk for {watchdog.message_id}: {e}")
+        return False
+    # An aborted transport can let the pending write return normally
+    return not watchdog.stalled
+
+
 async def stream_video_route(request: web.Request):
     """Handle video streaming requests with optimized streaming support."""
     client_manager = request.app.get('client_manager')
@@ -30,9 +387,27 @@ async def stream_video_route(request: web.Request):
     logger.info(f"Video stream request for message_id: {message_id} from {client_ip}")
 
     # Check bandwidth limit
-    if await is_bandwidth_limit_exceeded():
+    if await _bandwidth_limit_exceeded():
         raise web.HTTPServiceUnavailable(text="Service temporarily unavailable due to bandwidth limits.")
 
+    # HEAD probes only need headers; answer them from cached metadata without
+    # waiting for a streaming client.
+    if request.method == 'HEAD':
+        meta = get_cached_media_meta(message_id)
+        if meta is not None and meta[4] in VIDEO_MIME_TYPES and meta[3]:
+            status_code, headers, _, _ = _stream_headers(request, meta, message_id)
+            return web.Response(status=status_code, headers=headers)
+
+    watchdog = None
+
+    # Refuse extra concurrent streams from one IP before they reach Telegram
+    if not stream_throttle.try_acquire(client_ip):
+        logger.warning(f"Too many concurrent streams from {client_ip}, refusing {message_id}")
+        raise web.HTTPTooManyRequests(
+            text="Too many concurrent streams. Please try again shortly.",
+            headers=stream_throttle.retry_headers()
+        )
+
     try:
         # Increased timeout for client acquisition
         streamer_client = await asyncio.wait_for(
@@ -42,39 +417,15 @@ async def stream_video_route(request: web.Request):
         if not streamer_client or not streamer_client.is_connected:
             raise web.HTTPServiceUnavailable(text="Streaming service temporarily unavailable.")
 
-        logger.debug(f"Using client @{streamer_client.me.username} for video stream {message_id}")
+        logger.debug("Using client @%s for video stream %s", streamer_client.me.username, message_id)
 
-        # Get media message with retry logic
-        max_msg_retries = 2
-        media_msg = None
-        for msg_retry in range(max_msg_retries):
-            try:
-                media_msg = await asyncio.wait_for(
-                    get_media_message(streamer_client, message_id),
-                    timeout=30
-                )
-                break
-            except asyncio.TimeoutError:
-                if msg_retry < max_msg_retries - 1:
-                    logger.warning(f"Timeout getting message {message_id}, retry {msg_retry + 1}/{max_msg_retries}")
-                    await asyncio.sleep(2)
-                    continue
-                raise web.HTTPGatewayTimeout(text="Request timeout. Please try again.")
-            except Exception as e:
-                if msg_retry < max_msg_retries - 1:
-                    logger.warning(f"Error getting message {message_id}: {e}, retry {msg_retry + 1}/{max_msg_retries}")
-                    await asyncio.sleep(2)
-                    continue
-                raise
-
-        if not media_msg:
-            raise web.HTTPNotFound(text="File not found.")
-        
-        # Get file attributes
-        file_id, file_name, file_size, file_mime_type, file_unique_id = get_file_attr(media_msg)
-        
-        if not file_id:
-            raise web.HTTPNotFound(text="File not found or invalid.")
+        # Seeking browsers send many range requests for the same file; reuse
+        # the message metadata instead of asking Telegram every time.
+        meta = get_cached_media_meta(message_id)
+        if meta is None:
+            meta = await _fetch_stream_meta(streamer_client, message_id)
+            cache_media_meta(message_id, meta)
+        media_msg, file_id, file_name, file_size, file_mime_type = meta
 
         # Check if file is a video using shared VIDEO_MIME_TYPES
         if file_mime_type not in VIDEO_MIME_TYPES:
@@ -84,58 +435,21 @@ async def stream_video_route(request: web.Request):
         if file_size == 0:
             raise web.HTTPBadRequest(text="Invalid video file.")
 
-        logger.info(f"Streaming video {file_name} ({file_size} bytes, {file_mime_type}) for {message_id}")
-
-        # Streaming-optimized headers
-        headers = {
-            'Content-Type': file_mime_type,
-            'Accept-Ranges': 'bytes',
-            'Cache-Control': 'public, max-age=3600',  # Allow caching for better performance
-            'Connection': 'keep-alive',
-            'Content-Disposition': f'inline; filename="{file_name}"'
-        }
-
-        # Handle range requests for video seeking
-        range_header = request.headers.get('Range')
-        status_code = 200
-        start_offset = 0
-        end_offset = file_size - 1
-
-        if range_header:
-            logger.debug(f"Video range request for {message_id}: {range_header}")
-            range_result = validate_range_header(range_header, file_size)
-            if range_result is None:
-                raise web.HTTPRequestRangeNotSatisfiable(
-                    headers={'Content-Range': f'bytes */{file_size}'}
-                )
-            
-            start_offset, end_offset = range_result
-            
-            # Limit initial chunk size to prevent timeout on slow connections
-            requested_size = end_offset - start_offset + 1
-            max_initial_chunk = 10 * 1024 * 1024  # 10MB initial chunk
-            
-            if requested_size > max_initial_chunk and start_offset == 0:
-                # For initial requests, send smaller chunk
-                end_offset = start_offset + max_initial_chunk - 1
-                if end_offset >= file_size:
-                    end_offset = file_size - 1
-                logger.debug(f"Limited initial chunk from {requested_size} to {end_offset - start_offset + 1} bytes")
-            
-            headers['Content-Range'] = f'bytes {start_offset}-{end_offset}/{file_size}'
-            headers['Content-Length'] = str(end_offset - start_offset + 1)
-            status_code = 206
-            logger.info(f"Serving video range {start_offset}-{end_offset}/{file_size} ({end_offset - start_offset + 1} bytes) for {message_id}")
-        else:
-            headers['Content-Length'] = str(file_size)
-            logger.info(f"Serving full video {file_size} bytes for {message_id}")
+        status_code, headers, start_offset, end_offset = _stream_headers(request, meta, message_id)
 
+        if request.method == 'HEAD':
+            return web.Response(status=status_code, headers=headers)
+
+        # Content-Length is always set above, which keeps aiohttp on identity
+        # transfer-encoding (no chunk framing); never enable chunked encoding here.
         response = web.StreamResponse(status=status_code, headers=headers)
+        tune_stream_socket(request)
         await response.prepare(request)
 
         # --- REVISED STREAMING LOGIC ---
         # Using Pyrogram's high-level stream_media for better reliability and seeking.
         chunk_size = 1024 * 1024  # Pyrogram's stream_media uses 1MB chunks.
+        last_part = (file_size - 1) // chunk_size
         
         # Calculate chunk offset and how many bytes to skip in the first chunk.
         start_chunk = start_offset // chunk_size
@@ -145,12 +459,14 @@ async def stream_video_route(request: web.Request):
         bytes_to_serve = end_offset - start_offset + 1
 
         bytes_streamed = 0
+        # Progress is logged on crossing a threshold rather than testing every write.
+        next_log_at = STREAM_PROGRESS_LOG_BYTES
         request_id = f"stream_{message_id}_{encoded_id[:10]}"
-        max_retries = 2
         current_retry = 0
 
+        watchdog = _WriteWatchdog(message_id, request.transport)
         async with tracked_stream_response(response, stream_tracker, request_id):
-            while current_retry <= max_retries:
+            while current_retry <= STREAM_MAX_RETRIES:
                 try:
                     # CRITICAL: Calculate remaining bytes to stream based on what we've already sent
                     # This ensures proper resumption after client switches
@@ -167,43 +483,76 @@ async def stream_video_route(request: web.Request):
                     current_skip_bytes = current_byte_offset % chunk_size
                     
                     if bytes_streamed > 0:
-                        logger.debug(f"Resuming video stream for {message_id}. Already sent: {bytes_streamed}, Remaining: {remaining_bytes}")
+                        logger.debug("Resuming video stream for %s. Already sent: %d, Remaining: %d", message_id, bytes_streamed, remaining_bytes)
                     
+                    # Only request the chunks still needed for this range so Telegram
+                    # doesn't keep serving parts we would discard.
+                    needed_chunks = -(-(remaining_bytes + current_skip_bytes) // chunk_size)  # integer ceil
+
                     # Get the async generator for media chunks.
-                    # NOTE: stream_media offset parameter is in chunks, not bytes
-                    media_stream = streamer_client.stream_media(
+                    # NOTE: stream_media offset/limit parameters are in chunks, not bytes
+                    # Wrapped so the next Telegram part is fetched while the current one is written.
+                    # Head and tail parts may come from the in-process part cache.
+                    media_stream = _prefetched(_cached_parts(
+                        streamer_client,
                         media_msg,
-                        offset=current_start_chunk  # This is chunk offset, not byte offset
-                    )
+                        message_id,
+                        current_start_chunk,  # This is chunk offset, not byte offset
+                        needed_chunks,
+                        last_part
+                    ))
                     
-                    current_chunk = 0
-                    async for chunk in media_stream:
-                        if not chunk:
-                            break  # End of file.
+                    try:
+                        # Per-part bookkeeping is kept to plain local ints: the
+                        # head skip is consumed once and `room` counts down the
+                        # bytes this attempt may still buffer.
+                        head_skip = current_skip_bytes
+                        room = remaining_bytes
+                        buf = bytearray()
+                        async for chunk in media_stream:
+                            if not chunk:
+                                break  # End of file.
 
-                        # If this is the first chunk from our current position, skip the unneeded bytes from the beginning.
-                        if current_chunk == 0:
-                            chunk = chunk[current_skip_bytes:]
+                            # Trim through a memoryview so head/tail cuts don't copy the chunk.
+                            view = memoryview(chunk)
 
-                        # If this chunk would exceed our byte limit, truncate it.
-                        if bytes_streamed + len(chunk) > bytes_to_serve:
-                            chunk = chunk[:bytes_to_serve - bytes_streamed]
+                            # Skip the unneeded bytes at the start of the first part.
+                            if head_skip:
+                                view = view[head_skip:]
+                                head_skip = 0
 
-                        try:
-                            await response.write(chunk)
-                            bytes_streamed += len(chunk)
-                        except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError):
-                            logger.debug(f"Client disconnected during video stream {message_id}")
-                            return response  # Exit cleanly on client disconnect.
-                        except Exception as e:
-                            logger.error(f"Error streaming chunk for {message_id}: {e}")
-                            return response  # Exit on write errors.
-                        
-                        current_chunk += 1
-                        
-                        # Stop if we have served all required bytes.
-                        if bytes_streamed >= bytes_to_serve:
-                            break
+                            # If this chunk would exceed our byte limit, truncate it.
+                            if len(view) > room:
+                                view = view[:room]
+
+                            buf += view
+                            room -= len(view)
+
+                            # Coalesce Pyrogram's 1MB parts into larger writes.
+                            if len(buf) < STREAM_FLUSH_BYTES and room:
+                                continue
+
+                            if not await _write_buffer(response, buf, watchdog, client_ip):
+                                return response  # Client went away or write failed.
+                            bytes_streamed += len(buf)
+                            buf = bytearray()  # Fresh buffer: the transport may still reference the old one.
+
+                            if bytes_streamed >= next_log_at:
+                                logger.debug("Video stream %s: %d/%d bytes sent", message_id, bytes_streamed, bytes_to_serve)
+                                next_log_at += STREAM_PROGRESS_LOG_BYTES
+
+                            # Stop if we have served all required bytes.
+                            if not room:
+                                break
+
+                        # Flush whatever is left if Telegram ended the stream early.
+                        if buf:
+                            if not await _write_buffer(response, buf, watchdog, client_ip):
+                                return response
+                            bytes_streamed += len(buf)
+                    finally:
+                        # Stops the read-ahead task on every exit path.
+                        await media_stream.aclose()
                     
                     # If we reach here, streaming completed successfully.
                     break
@@ -230,14 +579,25 @@ async def stream_video_route(request: web.Request):
                 except Exception as e:
                     current_retry += 1
                     logger.error(f"Error during video streaming {message_id} (attempt {current_retry}): {e}")
-                    if current_retry > max_retries:
+                    if current_retry > STREAM_MAX_RETRIES:
                         logger.error(f"Max retries reached for {message_id}, aborting")
                         break
+                    if getattr(e, 'ID', None) in _STALE_MEDIA_ERRORS:
+                        # Only now is the message worth fetching again
+                        _META_CACHE.pop(message_id, None)
+                        try:
+                            media_msg = await get_media_message(streamer_client, message_id)
+                        except Exception as fetch_e:
+                            logger.error(f"Could not refresh media message {message_id}: {fetch_e}")
+                            break
+                        file_id, file_name, file_size, file_mime_type, _ = get_file_attr(media_msg)
+                        if file_id:
+                            cache_media_meta(message_id, (media_msg, file_id, file_name, file_size, file_mime_type))
                     await asyncio.sleep(2 * current_retry)  # Exponential backoff
 
         # Record bandwidth usage
         if bytes_streamed > 0:
-            await add_bandwidth_usage(bytes_streamed)
+            record_bandwidth_usage(bytes_streamed)
 
         logger.info(f"Video stream completed for {message_id}: {bytes_streamed} bytes (expected: {bytes_to_serve})")
         return response
@@ -247,3 +607,7 @@ async def stream_video_route(request: web.Request):
     except Exception as e:
         logger.error(f"Unexpected error in video streaming {message_id}: {e}", exc_info=True)
         raise web.HTTPInternalServerError(text="Streaming error occurred.")
+    finally:
+        if watchdog is not None:
+            watchdog.close()
+        stream_throttle.release(client_ip)
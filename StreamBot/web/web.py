@@ -1,10 +1,11 @@
 # StreamBot/web.py
 import re
 import logging
+import mimetypes
 import asyncio
 import datetime
 import os
-import math
+import time
 from aiohttp import web
 import aiohttp_cors
 import jinja2
@@ -12,81 +13,274 @@ from pyrogram import Client
 from pyrogram.errors import FloodWait, FileIdInvalid, RPCError
 from pyrogram.types import Message, User
 import aiohttp_jinja2
+from aiohttp_jinja2 import render_template
 from StreamBot.config import Var
 # Ensure decode_message_id is imported from utils
-from StreamBot.utils.utils import get_file_attr, humanbytes, decode_message_id, get_media_message
+from StreamBot.utils.utils import get_file_attr, humanbytes, decode_message_id, get_media_message, UserSessionRef
 from StreamBot.utils.file_properties import parse_file_id
 from StreamBot.utils.exceptions import NoClientsAvailableError # Import custom exception
-from StreamBot.utils.bandwidth import is_bandwidth_limit_exceeded, add_bandwidth_usage
+from StreamBot.utils.bandwidth import is_bandwidth_limit_exceeded, get_current_bandwidth_usage, record_bandwidth_usage, bandwidth_flush_loop
 from StreamBot.utils.stream_cleanup import stream_tracker, tracked_stream_response
 from StreamBot.security.middleware import SecurityMiddleware
 from StreamBot.security.validator import validate_range_header, sanitize_filename, get_client_ip
 from StreamBot.utils.custom_dl import ByteStreamer
-from .streaming import stream_video_route
-from .health_routes import routes as health_routes
-from ..utils.stream_cleanup import stream_tracker, tracked_stream_response
-from ..utils.bandwidth import is_bandwidth_limit_exceeded, add_bandwidth_usage
-from ..utils.exceptions import NoClientsAvailableError
+from .streaming import stream_video_route, tune_stream_socket, get_cached_media_meta, cache_media_meta, STREAM_FLUSH_BYTES
+from .health_routes import routes as health_routes, setup_health_checks, format_uptime
 from ..session_generator.interactive_login import interactive_login_manager
 from .auth_cookies import set_auth_cookies, get_session_token
 from ..security.rate_limiter import invalid_request_guard
-
+from ..session_generator.session_manager import session_manager
+from ..session_generator.telegram_auth import telegram_auth
+from ..database.user_sessions import get_user_session_info, store_user_session, check_user_has_session
+from ..utils.proxy_manager import proxy_manager
+from ..link_handler import user_session_streamer
+
+import json
+import heapq
 import hashlib
+import functools
+import secrets
 from typing import Optional, Dict, Any
 
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Optional shared token store; tokens stay in memory otherwise
+    aioredis = None
+
+try:
+    import orjson
+except ImportError:  # Optional fast path; the stdlib decoder is used otherwise
+    orjson = None
+
 
 logger = logging.getLogger(__name__)
 
+# Bound once at import time for the uptime/info handlers
+_utcnow = datetime.datetime.now
+_UTC = datetime.timezone.utc
+
 routes = web.RouteTableDef()
 
+# Session generator POST bodies are decoded straight from the raw bytes
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+async def _read_json(request: web.Request):
+    """Parse a JSON request body without decoding it to str first."""
+    return _json_loads(await request.read())
+
+
+def _json_dumps(data) -> bytes:
+    """Serialize to JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode('utf-8')
+
+
+def _json_response(data, status: int = 200) -> web.Response:
+    """JSON response whose body is already bytes, so aiohttp needn't re-encode it."""
+    return web.Response(body=_json_dumps(data), status=status, content_type='application/json')
+
+
+# Constant session generator error replies as (status, preserialized body);
+# sending one is a dict lookup and a Response, with no JSON encoding
+_ERROR_PAYLOADS = {
+    'invalid_session': (401, {'status': 'error', 'message': 'Invalid or expired session.'}),
+    'account_mismatch': (400, {
+        'status': 'error',
+        'message': 'Account mismatch. The logged-in account does not match the widget account.'
+    }),
+    'store_failed': (500, {'status': 'error', 'message': 'Failed to store session. Please try again.'}),
+    'proxy_port_required': (400, {'status': 'error', 'message': 'Proxy port is required when proxy host is provided'}),
+    'invalid_proxy_port': (400, {'status': 'error', 'message': 'Invalid proxy port number'}),
+    'missing_fields': (400, {'status': 'error', 'message': 'API ID, API Hash, and phone number are required.'}),
+    'invalid_api_id': (400, {'status': 'error', 'message': 'Invalid API ID format.'}),
+    'send_code_failed': (500, {'status': 'error', 'message': 'An error occurred. Please try again.'}),
+    'code_timeout': (504, {'status': 'timeout', 'message': 'Verification timed out. Please request a new code.'}),
+    'password_timeout': (504, {'status': 'timeout', 'message': '2FA verification timed out. Please request a new code.'}),
+    'invalid_telegram_auth': (400, {'success': False, 'error': 'Invalid Telegram authentication'}),
+    'access_restricted': (403, {
+        'success': False,
+        'error': 'Access to the session generator is restricted to administrators.'
+    }),
+    'auth_failed': (500, {'success': False, 'error': 'An internal server error occurred.'}),
+}
+_ERRORS = {key: (status, _json_dumps(payload)) for key, (status, payload) in _ERROR_PAYLOADS.items()}
+
+
+def _err(key: str) -> web.Response:
+    """Build the preserialized error reply registered under ``key`` in _ERRORS."""
+    status, body = _ERRORS[key]
+    return web.Response(body=body, status=status, content_type='application/json')
+
+# Session generator assets, resolved once at import
+_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../session_generator/templates")
+_STATIC_PATH = os.path.join(os.path.dirname(__file__), '..', 'session_generator', 'static')
+# Templates rendered by the session generator routes, compiled at startup
+_SESSION_TEMPLATES = ('index.html', 'login.html', 'session_complete.html')
+
+# /session/static files, read into memory by setup_webapp:
+# filename -> (body, content_type, etag). Repeat visitors revalidate with
+# If-None-Match and get a 304 without any disk access.
+_SESSION_STATIC: Dict[str, tuple] = {}
+_SESSION_STATIC_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def _load_session_static(static_path: str) -> None:
+    """Read the session generator assets and hash them for ETags."""
+    for name in os.listdir(static_path):
+        path = os.path.join(static_path, name)
+        # Same rules add_static enforced: plain files only, no symlinks
+        if os.path.islink(path) or not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            body = f.read()
+        etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        _SESSION_STATIC[name] = (body, content_type, etag)
+
+
+async def session_static_route(request: web.Request):
+    """Serve a session generator asset from memory."""
+    entry = _SESSION_STATIC.get(request.match_info['filename'])
+    if entry is None:
+        raise web.HTTPNotFound()
+    body, content_type, etag = entry
+    headers = {'ETag': etag, 'Cache-Control': _SESSION_STATIC_CACHE_CONTROL}
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type=content_type, headers=headers)
+
 # Favicon route to prevent 404 errors
+# A simple transparent 1x1 PNG as ICO, built once; browsers may cache it for a week
+_FAVICON_BODY = b'\x00\x00\x01\x00\x01\x00\x01\x01\x00\x00\x00\x00\x00\x00(\x00\x00\x00\x16\x00\x00\x00(\x00\x00\x00\x01\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x80\x00\x00\x00\x00\x00\x00\x00'
+_FAVICON_HEADERS = {'Cache-Control': 'public, max-age=604800'}
+
 @routes.get("/favicon.ico")
 async def favicon_route(request: web.Request):
     """Serve a simple favicon to prevent 404 errors."""
-    # Return a simple transparent 1x1 PNG as ICO
-    favicon_data = b'\x00\x00\x01\x00\x01\x00\x01\x01\x00\x00\x00\x00\x00\x00(\x00\x00\x00\x16\x00\x00\x00(\x00\x00\x00\x01\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x80\x00\x00\x00\x00\x00\x00\x00'
-    return web.Response(body=favicon_data, content_type='image/x-icon')
+    return web.Response(body=_FAVICON_BODY, content_type='image/x-icon', headers=_FAVICON_HEADERS)
 
 # User session streaming is now integrated into the main download route
 
+# Session tokens live in Redis when REDIS_URL is configured, so every web
+# worker sees the same tokens and Redis expires them natively. Otherwise:
+# token -> {'user_id', 'created_at', 'expires_at'} (ints) in-process, with
+# _token_heap ordering (expires_at, token) so eviction only touches
+# expired entries instead of scanning the whole store. With Redis the same
+# store caches tokens already validated there, carrying their real expiry, so
+# the login -> success -> dashboard round trips don't each hit Redis.
+_token_redis = None  # set by _setup_token_cache when Redis is available
+_TOKEN_KEY_PREFIX = "session_token:"
+_token_store: Dict[str, Dict[str, int]] = {}
+_token_heap: list = []
+_token_cleanup_task: Optional[asyncio.Task] = None
+SESSION_TOKEN_TTL = 3600  # 1 hour expiry
+
+def _evict_expired_tokens(current_time: int) -> int:
+    """Drop tokens whose expiry has passed; returns how many heap entries were popped."""
+    popped = 0
+    while _token_heap and _token_heap[0][0] < current_time:
+        _, token = heapq.heappop(_token_heap)
+        _token_store.pop(token, None)
+        popped += 1
+    return popped
+
+async def _setup_token_cache(app: web.Application) -> None:
+    """Connect the shared token cache on startup when REDIS_URL is set."""
+    global _token_redis
+    if not Var.REDIS_URL:
+        return
+    if aioredis is None:
+        logger.warning("REDIS_URL is set but the redis package is not installed; session tokens stay in memory.")
+        return
+    try:
+        client = aioredis.from_url(Var.REDIS_URL, decode_responses=True)
+        await client.ping()
+    except Exception as e:
+        logger.error(f"Could not connect to Redis for session tokens, keeping them in memory: {e}")
+        return
+    _token_redis = client
+    logger.info("Session tokens are stored in Redis.")
+
+async def _close_token_cache(app: web.Application) -> None:
+    global _token_redis
+    client, _token_redis = _token_redis, None
+    if client is not None:
+        close = getattr(client, 'aclose', None) or client.close
+        await close()
+
+async def _start_bandwidth_flusher(app: web.Application) -> None:
+    # Served bytes are batched into one MongoDB update every few seconds
+    app['bandwidth_flush_task'] = asyncio.create_task(bandwidth_flush_loop())
+
+async def _stop_bandwidth_flusher(app: web.Application) -> None:
+    task = app.get('bandwidth_flush_task')
+    if task is not None:
+        task.cancel()  # the loop flushes whatever is still queued before exiting
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+# New-session DMs are sent by one background worker; the bounded queue caps
+# memory and concurrent Telegram calls when many logins finish at once
+_notify_queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+
+async def _notify_worker() -> None:
+    while True:
+        user_id, user_info = await _notify_queue.get()
+        try:
+            await session_manager.notify_bot_about_new_session(user_id, user_info)
+        except Exception as e:
+            logger.debug(f"Notify bot about new session failed for {user_id}: {e}")
+
+async def _start_notify_worker(app: web.Application) -> None:
+    app['session_notify_task'] = asyncio.create_task(_notify_worker())
+
+async def _stop_notify_worker(app: web.Application) -> None:
+    task = app.get('session_notify_task')
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
 # Helper function to check session generator access permissions
-def generate_session_token(user_id: int) -> str:
+async def generate_session_token(user_id: int) -> str:
     """Generate a secure session token for user authentication."""
-    import secrets
-    import hashlib
-    import time
-
-    # Create a unique token with timestamp and random data
-    timestamp = str(int(time.time()))
-    random_data = secrets.token_hex(16)
-    token_data = f"{user_id}:{timestamp}:{random_data}"
-
-    # Hash the token for security
-    token_hash = hashlib.sha256(token_data.encode()).hexdigest()
-
-    # Store token mapping (in production, use Redis or database)
-    # For now, we'll store in a simple in-memory dict
-    if not hasattr(generate_session_token, '_token_store'):
-        generate_session_token._token_store = {}
+    # The token is pure randomness: user and expiry live in the store, so
+    # hashing a user/timestamp payload would add no entropy
+    timestamp = int(time.time())
+    token = secrets.token_urlsafe(32)
+
+    if _token_redis is not None:
+        try:
+            await _token_redis.set(_TOKEN_KEY_PREFIX + token, user_id, ex=SESSION_TOKEN_TTL)
+            return token
+        except Exception as e:
+            logger.error(f"Redis unavailable for session token, storing in memory: {e}")
+
+    _store_token_locally(token, user_id, timestamp, timestamp + SESSION_TOKEN_TTL)
+    return token
+
+def _store_token_locally(token: str, user_id: int, created_at: int, expires_at: int) -> None:
+    global _token_cleanup_task
+
+    if _token_cleanup_task is None:
         # Start cleanup task for expired tokens
-        asyncio.create_task(cleanup_expired_tokens())
+        _token_cleanup_task = asyncio.create_task(cleanup_expired_tokens())
 
     # Clean up expired tokens before adding new one
-    current_time = int(time.time())
-    expired_tokens = [
-        token for token, data in generate_session_token._token_store.items()
-        if current_time > int(data['expires_at'])
-    ]
-    for token in expired_tokens:
-        del generate_session_token._token_store[token]
-
-    generate_session_token._token_store[token_hash] = {
+    _evict_expired_tokens(created_at)
+
+    _token_store[token] = {
         'user_id': user_id,
-        'created_at': timestamp,
-        'expires_at': str(int(time.time()) + 3600),  # 1 hour expiry
+        'created_at': created_at,
+        'expires_at': expires_at,
     }
-
-    return token_hash
+    heapq.heappush(_token_heap, (expires_at, token))
 
 async def cleanup_expired_tokens():
     """Periodically clean up expired session tokens."""
@@ -94,17 +288,9 @@ async def cleanup_expired_tokens():
         try:
             await asyncio.sleep(300)  # Clean up every 5 minutes
 
-            if hasattr(generate_session_token, '_token_store'):
-                current_time = int(datetime.datetime.now().timestamp())
-                expired_tokens = [
-                    token for token, data in generate_session_token._token_store.items()
-                    if current_time > int(data['expires_at'])
-                ]
-                for token in expired_tokens:
-                    del generate_session_token._token_store[token]
-
-                if expired_tokens:
-                    logger.debug(f"Cleaned up {len(expired_tokens)} expired session tokens")
+            expired_count = _evict_expired_tokens(int(time.time()))
+            if expired_count:
+                logger.debug(f"Cleaned up {expired_count} expired session tokens")
 
         except Exception as e:
             logger.error(f"Error cleaning up expired tokens: {e}")
@@ -112,23 +298,34 @@ async def cleanup_expired_tokens():
 
 async def validate_session_token(token: str) -> int | None:
     """Validate session token and return user_id if valid."""
-    import time
-
-    if not hasattr(generate_session_token, '_token_store'):
-        return None
-
-    token_data = generate_session_token._token_store.get(token)
-    if not token_data:
-        return None
-
-    # Check if token has expired
-    current_time = int(time.time())
-    if current_time > int(token_data['expires_at']):
-        # Remove expired token
-        del generate_session_token._token_store[token]
+    if not token:
         return None
+    now = int(time.time())
+    token_data = _token_store.get(token)
+    if token_data:
+        # Check if token has expired
+        if now > token_data['expires_at']:
+            # Remove expired token; its heap entry is discarded when popped
+            del _token_store[token]
+            return None
+        return token_data['user_id']
+
+    if _token_redis is not None:
+        key = _TOKEN_KEY_PREFIX + token
+        try:
+            async with _token_redis.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.ttl(key)
+                value, ttl = await pipe.execute()
+            if value:
+                user_id = int(value)
+                if ttl > 0:
+                    _store_token_locally(token, user_id, now, now + ttl)
+                return user_id
+        except Exception as e:
+            logger.error(f"Redis unavailable while validating session token: {e}")
 
-    return token_data['user_id']
+    return None
 
 def check_session_generator_access(user_id: int) -> bool:
     """Check if user has permission to access session generator features."""
@@ -142,29 +339,50 @@ def check_session_generator_access(user_id: int) -> bool:
 
     return False
 
+# /api/info bandwidth figures are reused for this long; the lock keeps a burst
+# of requests from all querying MongoDB when the entry goes stale.
+_BW_INFO_CACHE = {"ts": 0.0, "data": None}
+_BW_INFO_TTL = 30
+_bw_info_lock = asyncio.Lock()
+
+async def _cached_bandwidth_usage() -> dict:
+    """Return current bandwidth usage, refreshed at most every _BW_INFO_TTL seconds."""
+    if _BW_INFO_CACHE["data"] is not None and time.monotonic() - _BW_INFO_CACHE["ts"] < _BW_INFO_TTL:
+        return _BW_INFO_CACHE["data"]
+    async with _bw_info_lock:
+        # Another request may have refreshed it while we waited
+        if _BW_INFO_CACHE["data"] is None or time.monotonic() - _BW_INFO_CACHE["ts"] >= _BW_INFO_TTL:
+            _BW_INFO_CACHE["data"] = await get_current_bandwidth_usage()
+            _BW_INFO_CACHE["ts"] = time.monotonic()
+    return _BW_INFO_CACHE["data"]
+
 # Request timeout for streaming operations (2 hours max)
 STREAM_TIMEOUT = 7200  # 2 hours
 
-# --- Helper: Format Uptime 
-def format_uptime(start_time_dt: datetime.datetime) -> str:
-    """Format the uptime into a human-readable string."""
-    if start_time_dt is None:
-        return "N/A"
-    now = datetime.datetime.now(datetime.timezone.utc)
-    delta = now - start_time_dt
-    days = delta.days
-    hours, rem = divmod(delta.seconds, 3600)
-    minutes, seconds = divmod(rem, 60)
-
-    uptime_str = ""
-    if days > 0:
-        uptime_str += f"{days}d "
-    if hours > 0:
-        uptime_str += f"{hours}h "
-    if minutes > 0:
-        uptime_str += f"{minutes}m "
-    uptime_str += f"{seconds}s"
-    return uptime_str.strip() if uptime_str else "0s"
+# Telegram parts are 1 MiB (2**20) for /dl range arithmetic
+_CHUNK_SHIFT = 20
+_CHUNK_MASK = (1 << _CHUNK_SHIFT) - 1
+
+# /dl header templates keyed by (file_name, mime_type); requests copy one and
+# add their own Content-Length/Content-Range
+_DL_HEADERS_CACHE: dict = {}
+_DL_HEADERS_MAX = 1024
+
+
+def _download_headers(file_name: str, file_mime_type) -> dict:
+    """Return a fresh copy of the cached /dl response headers for a file."""
+    key = (file_name, file_mime_type)
+    template = _DL_HEADERS_CACHE.get(key)
+    if template is None:
+        if len(_DL_HEADERS_CACHE) >= _DL_HEADERS_MAX:
+            _DL_HEADERS_CACHE.pop(next(iter(_DL_HEADERS_CACHE)), None)
+        template = {
+            'Content-Type': file_mime_type or 'application/octet-stream',
+            'Content-Disposition': f'attachment; filename="{sanitize_filename(file_name)}"',
+            'Accept-Ranges': 'bytes'
+        }
+        _DL_HEADERS_CACHE[key] = template
+    return template.copy()
 
 # get_media_message function moved to utils.py to avoid circular imports
 
@@ -177,7 +395,8 @@ async def download_route(request: web.Request):
         logger.error("ClientManager not found in web app state.")
         raise web.HTTPServiceUnavailable(text="Service configuration error.")
 
-    start_time_request = asyncio.get_event_loop().time()
+    loop = asyncio.get_running_loop()
+    start_time_request = loop.time()
 
     encoded_id = request.match_info['encoded_id_str']
 
@@ -208,7 +427,7 @@ async def download_route(request: web.Request):
 
     try:
         # Check if this is a user session file (virtual message ID)
-        is_user_session = isinstance(message_id, str) and message_id.startswith('user_')
+        is_user_session = isinstance(message_id, UserSessionRef)
         if is_user_session:
             # Handle user session file - anyone with the link can download
             # This is intentional: users can share their generated links with others
@@ -220,13 +439,12 @@ async def download_route(request: web.Request):
             session_info = bot_client.user_session_files[message_id]
 
             # Check if expired (24 hours)
-            current_time = asyncio.get_event_loop().time()
+            current_time = loop.time()
             if current_time - session_info['created_at'] > 86400:
                 del bot_client.user_session_files[message_id]
                 raise web.HTTPGone(text="Download link has expired.")
 
             # Get user's client for streaming
-            from StreamBot.link_handler import user_session_streamer
             user_client = await user_session_streamer.get_user_client(session_info['user_id'])
             if not user_client:
                 raise web.HTTPUnauthorized(text="User session expired. Please login again.")
@@ -253,12 +471,20 @@ async def download_route(request: web.Request):
                 client_manager.get_streaming_client(),
                 timeout=60  # Increased from 30 to 60 seconds for large file handling
             )
-            if not streamer_client or not getattr(streamer_client, "is_connected", False):
+            if not streamer_client or not streamer_client.is_connected:
                 logger.error(f"Failed to obtain a connected streaming client for message_id {message_id}")
                 raise web.HTTPServiceUnavailable(text="Service temporarily overloaded. Please try again shortly.")
             logger.debug(f"Using client @{streamer_client.me.username} for streaming message_id {message_id}")
-            # Fetch the media message from the log channel using bot/worker client
-            media_msg = await get_media_message(streamer_client, message_id)
+            # Fetch the media message from the log channel using bot/worker client,
+            # unless a recent /dl or /stream request already did
+            cached_meta = get_cached_media_meta(message_id)
+            if cached_meta is not None:
+                media_msg = cached_meta[0]
+            else:
+                media_msg = await get_media_message(streamer_client, message_id)
+                file_id_str, file_name, file_size, file_mime_type, _ = get_file_attr(media_msg)
+                if file_id_str:
+                    cache_media_meta(message_id, (media_msg, file_id_str, file_name, file_size, file_mime_type))
             # Get ByteStreamer instance for the client from ClientManager
             byte_streamer = client_manager.get_streamer_for_client(streamer_client)
             if not byte_streamer:
@@ -285,8 +511,9 @@ async def download_route(request: web.Request):
             if not file_id:
                 raise FileNotFoundError("Unable to parse file id from user session message")
         else:
-            # For regular files in log channel, get properties by message_id
-            file_id = await byte_streamer.get_file_properties(message_id)
+            # For regular files in log channel, get properties by message_id;
+            # media_msg was fetched above, so a cache miss needs no second RPC
+            file_id = await byte_streamer.get_file_properties(message_id, media_msg)
     except FileNotFoundError:
         logger.error(f"File properties not found for message {message_id}")
         raise web.HTTPNotFound(text="File not found or has been deleted.")
@@ -301,25 +528,20 @@ async def download_route(request: web.Request):
         logger.warning(f"No filename could be determined for message {message_id}")
         file_name = f"file_{message_id}"
 
-    # Sanitize filename for security
-    safe_filename = sanitize_filename(file_name)
-
     # Validate file size
     if file_size == 0:
         logger.warning(f"File size is 0 for message {message_id}")
         # Don't raise error, let it proceed for 0-byte files
 
-
-    headers = {
-        'Content-Type': file_mime_type or 'application/octet-stream',
-        'Content-Disposition': f'attachment; filename="{safe_filename}"',
-        'Accept-Ranges': 'bytes'
-    }
+    # Filename is sanitized once per (file_name, mime_type) when the template is built
+    headers = _download_headers(file_name, file_mime_type)
 
     range_header = request.headers.get('Range')
     status_code = 200
     start_offset = 0
     end_offset = file_size - 1 if file_size > 0 else 0 # Handle 0-byte files for end_offset
+    # Formatted once; shared by Content-Range/Content-Length below
+    file_size_str = str(file_size)
     is_range_request = False
 
     if range_header:
@@ -329,24 +551,26 @@ async def download_route(request: web.Request):
         range_result = validate_range_header(range_header, file_size)
         if range_result is None:
             logger.error(f"Invalid Range header '{range_header}' for file size {file_size}")
-            raise web.HTTPRequestRangeNotSatisfiable(headers={'Content-Range': f'bytes */{file_size}'})
+            raise web.HTTPRequestRangeNotSatisfiable(headers={'Content-Range': 'bytes */' + file_size_str})
 
         start_offset, end_offset = range_result
-        headers['Content-Range'] = f'bytes {start_offset}-{end_offset}/{file_size}'
-        headers['Content-Length'] = str(end_offset - start_offset + 1)
+        content_length = end_offset - start_offset + 1
+        headers['Content-Range'] = 'bytes %d-%d/%s' % (start_offset, end_offset, file_size_str)
+        headers['Content-Length'] = str(content_length)
         status_code = 206
         is_range_request = True
-        logger.info(f"Serving range request for {message_id}: bytes {start_offset}-{end_offset}/{file_size}. Content-Length: {headers['Content-Length']}")
+        logger.info(f"Serving range request for {message_id}: bytes {start_offset}-{end_offset}/{file_size_str}. Content-Length: {content_length}")
 
     else:
-        headers['Content-Length'] = str(file_size)
-        logger.info(f"Serving full download for {message_id}. File size: {humanbytes(file_size)}. Content-Length: {headers['Content-Length']}")
+        headers['Content-Length'] = file_size_str
+        logger.info(f"Serving full download for {message_id}. File size: {humanbytes(file_size)}. Content-Length: {file_size_str}")
 
     response = web.StreamResponse(status=status_code, headers=headers)
+    tune_stream_socket(request)
     await response.prepare(request)
 
     bytes_streamed = 0
-    stream_start_time = asyncio.get_event_loop().time()
+    stream_start_time = loop.time()
     max_retries_stream = 2
     current_retry_stream = 0
 
@@ -359,12 +583,13 @@ async def download_route(request: web.Request):
         return response
 
     # Calculate streaming parameters based on WebStreamer approach
-    chunk_size = 1024 * 1024  # 1MB chunks
+    # chunk_size is a power of two, so part maths is shifts and masks
+    chunk_size = 1 << _CHUNK_SHIFT  # 1MB chunks
     until_bytes = min(end_offset, file_size - 1)
-    offset = start_offset - (start_offset % chunk_size)
+    offset = start_offset & ~_CHUNK_MASK
     first_part_cut = start_offset - offset
-    last_part_cut = until_bytes % chunk_size + 1
-    part_count = math.ceil((until_bytes + 1) / chunk_size) - math.floor(offset / chunk_size)
+    last_part_cut = (until_bytes & _CHUNK_MASK) + 1
+    part_count = (until_bytes >> _CHUNK_SHIFT) - (offset >> _CHUNK_SHIFT) + 1
 
     logger.debug(f"Preparing WebStreamer-style streaming for {message_id}. Range: {start_offset}-{end_offset}, Offset: {offset}, Parts: {part_count}")
 
@@ -385,36 +610,47 @@ async def download_route(request: web.Request):
                         logger.info(f"All bytes already streamed for {message_id}. Total: {humanbytes(bytes_streamed)}")
                         break
 
-                    # Recalculate streaming parameters for remaining data (memory-efficient)
-                    remaining_offset = remaining_start_offset - (remaining_start_offset % chunk_size)
+                    # Only the start of the range moves on a resume; until_bytes and
+                    # last_part_cut computed above stay valid for every attempt.
+                    remaining_offset = remaining_start_offset & ~_CHUNK_MASK
                     remaining_first_part_cut = remaining_start_offset - remaining_offset
-                    remaining_until_bytes = min(end_offset, file_size - 1)
-                    remaining_last_part_cut = remaining_until_bytes % chunk_size + 1
-                    remaining_part_count = math.ceil((remaining_until_bytes + 1) / chunk_size) - math.floor(remaining_offset / chunk_size)
+                    remaining_part_count = (until_bytes >> _CHUNK_SHIFT) - (remaining_offset >> _CHUNK_SHIFT) + 1
 
                     if bytes_streamed > 0:
                         logger.debug(f"Resuming stream for {message_id}. Already sent: {humanbytes(bytes_streamed)}, Remaining: {humanbytes(remaining_bytes)}")
 
                     # Create the streaming coroutine using ByteStreamer
+                    async def write_buffer(buf: bytearray) -> bool:
+                        nonlocal bytes_streamed
+                        try:
+                            await response.write(buf)
+                            bytes_streamed += len(buf)
+                            return True
+                        except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError) as client_e:
+                            logger.warning(f"Client connection issue during write for {message_id}: {type(client_e).__name__}. Streamed {humanbytes(bytes_streamed)}.")
+                        except Exception as write_e:
+                            logger.error(f"Error writing chunk for {message_id}: {write_e}", exc_info=True)
+                        return False
+
                     async def stream_data():
+                        # Coalesce the 1MB parts into STREAM_FLUSH_BYTES writes
+                        buf = bytearray()
                         async for chunk in byte_streamer.yield_file(
                             file_id,
                             remaining_offset,
                             remaining_first_part_cut,
-                            remaining_last_part_cut,
+                            last_part_cut,
                             remaining_part_count,
                             chunk_size
                         ):
-                            try:
-                                await response.write(chunk)
-                                nonlocal bytes_streamed
-                                bytes_streamed += len(chunk)
-                            except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError) as client_e:
-                                logger.warning(f"Client connection issue during write for {message_id}: {type(client_e).__name__}. Streamed {humanbytes(bytes_streamed)}.")
-                                return
-                            except Exception as write_e:
-                                logger.error(f"Error writing chunk for {message_id}: {write_e}", exc_info=True)
+                            buf += chunk
+                            if len(buf) < STREAM_FLUSH_BYTES:
+                                continue
+                            if not await write_buffer(buf):
                                 return
+                            buf = bytearray()
+                        if buf:
+                            await write_buffer(buf)
 
                     # Apply timeout to the entire streaming operation
                     await asyncio.wait_for(stream_data(), timeout=STREAM_TIMEOUT)
@@ -470,12 +706,12 @@ async def download_route(request: web.Request):
                 logger.error(f"Unexpected error during WebStreamer-style streaming for {message_id}: {e}", exc_info=True)
                 return response
 
-    stream_duration = asyncio.get_event_loop().time() - stream_start_time
+    stream_duration = loop.time() - stream_start_time
     expected_bytes_to_serve = (end_offset - start_offset + 1)
 
     # Always record bandwidth for bytes actually streamed, if any
     if bytes_streamed > 0:
-        await add_bandwidth_usage(bytes_streamed)
+        record_bandwidth_usage(bytes_streamed)
         logger.info(f"Recorded {humanbytes(bytes_streamed)} for bandwidth usage for {message_id}.")
 
     if bytes_streamed == expected_bytes_to_serve:
@@ -483,7 +719,7 @@ async def download_route(request: web.Request):
     else:
         logger.warning(f"Stream for {message_id} ended. Expected to serve {humanbytes(expected_bytes_to_serve)}, actually sent {humanbytes(bytes_streamed)} in {stream_duration:.2f}s.")
 
-    total_request_duration = asyncio.get_event_loop().time() - start_time_request
+    total_request_duration = loop.time() - start_time_request
     logger.info(f"Download request for {message_id} completed. Total duration: {total_request_duration:.2f}s")
     return response
 
@@ -512,8 +748,7 @@ async def api_info_route(request: web.Request):
     # Get bandwidth usage information
     bandwidth_info = {}
     try:
-        from StreamBot.utils.bandwidth import get_current_bandwidth_usage
-        bandwidth_usage = await get_current_bandwidth_usage()
+        bandwidth_usage = await _cached_bandwidth_usage()
         bandwidth_info = {
             "limit_gb": Var.BANDWIDTH_LIMIT_GB,
             "used_gb": bandwidth_usage["gb_used"],
@@ -553,7 +788,7 @@ async def api_info_route(request: web.Request):
             "bot_info": {"id": bot_me.id, "username": bot_me.username, "first_name": bot_me.first_name, "mention": bot_me.mention},
             "features": features, "uptime": format_uptime(start_time),
             "github_repo": Var.GITHUB_REPO_URL,
-            "server_time_utc": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "server_time_utc": _utcnow(_UTC).isoformat(),
             "totaluser": user_count,
             "bandwidth_info": bandwidth_info
         }
@@ -575,6 +810,8 @@ async def setup_webapp(bot_instance: Client, client_manager, start_time: datetim
 
     # Store bot instance and client manager
     app['bot_client'] = bot_instance
+    # Bot identity is resolved once at startup (see __main__) and read by the routes
+    app['bot_me'] = getattr(bot_instance, 'me', None)
     app['client_manager'] = client_manager
     # Store both keys for compatibility with existing code paths
     app['bot_start_time'] = start_time
@@ -583,6 +820,13 @@ async def setup_webapp(bot_instance: Client, client_manager, start_time: datetim
     # Add routes
     app.add_routes(routes)
     app.add_routes(health_routes)
+    setup_health_checks(app)
+    app.on_startup.append(_setup_token_cache)
+    app.on_cleanup.append(_close_token_cache)
+    app.on_startup.append(_start_bandwidth_flusher)
+    app.on_cleanup.append(_stop_bandwidth_flusher)
+    app.on_startup.append(_start_notify_worker)
+    app.on_cleanup.append(_stop_notify_worker)
 
     # Configure CORS
     if Var.CORS_ALLOWED_ORIGINS:
@@ -600,49 +844,72 @@ async def setup_webapp(bot_instance: Client, client_manager, start_time: datetim
     else:
         logger.warning("CORS_ALLOWED_ORIGINS is not set. The Telegram login widget may not work on external domains.")
 
-    # Setup Jinja2 templates
-    template_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../session_generator/templates")
-    aiohttp_jinja2.setup(app, loader=jinja2.FileSystemLoader(template_path))
+    # Setup Jinja2 templates; compile the session pages now so the first
+    # visitor doesn't pay for parsing them
+    jinja_env = aiohttp_jinja2.setup(app, loader=jinja2.FileSystemLoader(_TEMPLATE_PATH))
+    for template_name in _SESSION_TEMPLATES:
+        try:
+            jinja_env.get_template(template_name)
+        except jinja2.TemplateError as e:
+            logger.warning(f"Could not precompile template {template_name}: {e}")
 
-    # Setup static files for session generator with caching
-    static_path = os.path.join(os.path.dirname(__file__), '..', 'session_generator', 'static')
+    # Setup static files for session generator, served from memory with ETags
+    static_path = _STATIC_PATH
     if os.path.exists(static_path):
-        app.router.add_static(
-            '/session/static',
-            static_path,
-            name='session_static',
-            show_index=False,  # Security: don't show directory listings
-            follow_symlinks=False  # Security: don't follow symlinks
-        )
-        logger.info(f"Static files configured for session generator at: {static_path}")
+        _load_session_static(static_path)
+        app.router.add_get('/session/static/{filename}', session_static_route, name='session_static')
+        logger.info(f"Static files configured for session generator at: {static_path} ({len(_SESSION_STATIC)} files)")
 
     logger.info("Web application routes configured with security middleware.")
     return app
 
-# Add these routes after the existing routes
-@routes.get("/stream/{encoded_id_str}")
-async def stream_route(request: web.Request):
-    """Route handler for video streaming."""
-    return await stream_video_route(request)
+# Video streaming is implemented in streaming.py; registered directly so each
+# request doesn't pass through a forwarding coroutine
+routes.get("/stream/{encoded_id_str}")(stream_video_route)
 
 # --- Session Generator Routes ---
+@functools.lru_cache(maxsize=1024)
+def _avatar_url_for(user_id: int) -> str:
+    """Deterministic DiceBear identicon URL for a user, seeded with SHA-256 of the ID.
+
+    SHA-256 is kept rather than a shorter BLAKE2b digest: the seed decides the
+    identicon, so changing the hash would give every existing user a new avatar,
+    and with the lru_cache each ID is only hashed once anyway.
+    """
+    avatar_seed = hashlib.sha256(str(user_id).encode('utf-8')).hexdigest()
+    return f"https://api.dicebear.com/7.x/identicon/svg?seed={avatar_seed}&size=128"
+
+# index.html context entries that only depend on configuration
+_INDEX_CONTEXT = {
+    'base_url': Var.BASE_URL,
+    'app_name': 'Telegram Session Generator',
+    'allow_user_login': Var.ALLOW_USER_LOGIN,
+    'login_restricted': not Var.ALLOW_USER_LOGIN
+}
+# Rendered index.html bytes keyed by (bot_username, bot_id)
+_INDEX_HTML: Dict[tuple, bytes] = {}
+
+async def _resolve_authenticated_user(request: web.Request) -> tuple[Optional[int], Optional[dict]]:
+    """Resolve the cookie/header session token to (user_id, stored session info)."""
+    session_token = get_session_token(request)
+    if not session_token:
+        return None, None
+    user_id = await validate_session_token(session_token)
+    if not user_id:
+        return None, None
+    return user_id, await get_user_session_info(user_id)
+
 @routes.get("/session")
 async def session_generator_route(request: web.Request):
     """Session generator main page route."""
-    from aiohttp_jinja2 import render_template
 
     bot_client: Client = request.app['bot_client']
 
     # If already authenticated via cookie and has session, go to success page
     try:
-        session_token = get_session_token(request)
-        if session_token:
-            user_id = await validate_session_token(session_token)
-            if user_id:
-                from StreamBot.database.user_sessions import get_user_session_info
-                user_info = await get_user_session_info(user_id)
-                if user_info:
-                    return web.HTTPFound('/session/success')
+        _, user_info = await _resolve_authenticated_user(request)
+        if user_info:
+            return web.HTTPFound('/session/success')
     except Exception:
         pass
 
@@ -656,16 +923,16 @@ async def session_generator_route(request: web.Request):
     except Exception as e:
         logger.warning(f"Could not get bot info for session generator: {e}")
 
-    context = {
-        'bot_username': bot_username,
-        'bot_id': bot_id,
-        'base_url': Var.BASE_URL,
-        'app_name': 'Telegram Session Generator',
-        'allow_user_login': Var.ALLOW_USER_LOGIN,
-        'login_restricted': not Var.ALLOW_USER_LOGIN
-    }
+    # The page only varies with the bot identity, so render it once per identity
+    cache_key = (bot_username, bot_id)
+    body = _INDEX_HTML.get(cache_key)
+    if body is None:
+        context = {**_INDEX_CONTEXT, 'bot_username': bot_username, 'bot_id': bot_id}
+        body = aiohttp_jinja2.render_string('index.html', request, context).encode('utf-8')
+        _INDEX_HTML[cache_key] = body
 
-    return render_template('index.html', request, context)
+    # A fresh Response each time: middleware adds headers to it
+    return web.Response(body=body, content_type='text/html', charset='utf-8')
 
 #l Slupport trailing slash by redirecting to canonical path
 @routes.get("/session/")
@@ -675,17 +942,12 @@ async def session_generator_route_slash(request: web.Request):
 @routes.get("/session/login")
 async def session_login_route(request: web.Request):
     """Route to display the interactive login form."""
-    from aiohttp_jinja2 import render_template
 
     # If already authenticated via cookie and has session, go to success page
     try:
-        session_token_cookie = get_session_token(request)
-        if session_token_cookie:
-            cookie_user_id = await validate_session_token(session_token_cookie)
-            if cookie_user_id:
-                from StreamBot.database.user_sessions import get_user_session_info
-                if await get_user_session_info(cookie_user_id):
-                    return web.HTTPFound('/session/success')
+        _, cookie_user_info = await _resolve_authenticated_user(request)
+        if cookie_user_info:
+            return web.HTTPFound('/session/success')
     except Exception:
         pass
 
@@ -701,62 +963,114 @@ async def session_login_route(request: web.Request):
     }
     return render_template('login.html', request, context)
 
+def _optional_str(value) -> Optional[str]:
+    """Stripped string form field; missing, null, non-string and blank values become None."""
+    if not isinstance(value, str):
+        return None
+    return value.strip() or None
+
 @routes.post("/session/send_code")
 async def session_send_code_route(request: web.Request):
     """Handle API credentials and phone number submission to send verification code."""
-    data = await request.json()
+    data = await _read_json(request)
     token = data.get('token')
     api_id = data.get('api_id')
     api_hash = data.get('api_hash')
     phone_number = data.get('phone_number')
     # Proxy configuration (optional)
-    proxy_host = data.get('proxy_host', '').strip() or None
+    proxy_host = _optional_str(data.get('proxy_host'))
     proxy_port = data.get('proxy_port')
-    proxy_type = data.get('proxy_type', 'http').strip().lower()
-    proxy_username = data.get('proxy_username', '').strip() or None
-    proxy_password = data.get('proxy_password', '').strip() or None
+    proxy_type = (_optional_str(data.get('proxy_type')) or 'http').lower()
+    proxy_username = _optional_str(data.get('proxy_username'))
+    proxy_password = _optional_str(data.get('proxy_password'))
 
     # Validate proxy configuration if provided
     if proxy_host:
         if not proxy_port:
-            return web.json_response({'status': 'error', 'message': 'Proxy port is required when proxy host is provided'}, status=400)
+            return _err('proxy_port_required')
 
         try:
             proxy_port = int(proxy_port)
         except (ValueError, TypeError):
-            return web.json_response({'status': 'error', 'message': 'Invalid proxy port number'}, status=400)
+            return _err('invalid_proxy_port')
 
-        from StreamBot.utils.proxy_manager import proxy_manager
         is_valid, error_msg = proxy_manager.validate_proxy_input(proxy_host, str(proxy_port), proxy_type)
         if not is_valid:
-            return web.json_response({'status': 'error', 'message': f'Proxy validation failed: {error_msg}'}, status=400)
+            return _json_response({'status': 'error', 'message': f'Proxy validation failed: {error_msg}'}, status=400)
 
     user_id = await validate_session_token(token)
     if not user_id:
-        return web.json_response({'status': 'error', 'message': 'Invalid or expired session.'}, status=401)
+        return _err('invalid_session')
 
     # Validate input
     if not api_id or not api_hash or not phone_number:
-        return web.json_response({'status': 'error', 'message': 'API ID, API Hash, and phone number are required.'}, status=400)
+        return _err('missing_fields')
 
     try:
         api_id = int(api_id)
     except (ValueError, TypeError):
-        return web.json_response({'status': 'error', 'message': 'Invalid API ID format.'}, status=400)
+        return _err('invalid_api_id')
 
     try:
         result = await interactive_login_manager.start_login(
             user_id, api_id, api_hash, phone_number, proxy_host, proxy_port, proxy_type, proxy_username, proxy_password
         )
-        return web.json_response(result)
+        return _json_response(result)
     except Exception as e:
         logger.error(f"Error in send_code route: {e}")
-        return web.json_response({'status': 'error', 'message': 'An error occurred. Please try again.'}, status=500)
+        return _err('send_code_failed')
+
+async def _commit_login(user_id: int, result: dict) -> Optional[web.Response]:
+    """Check and persist a successful interactive login; returns an error response or None."""
+    # SECURITY: Verify that the logged-in user matches the widget user
+    logged_in_user_info = result.get('user_info')
+    if not logged_in_user_info or logged_in_user_info.get('id') != user_id:
+        await interactive_login_manager.cleanup_client(user_id)
+        return _err('account_mismatch')
+
+    # Store the session while the login client disconnects; the disconnect
+    # goes first so its network wait overlaps the database write
+    _, session_stored = await asyncio.gather(
+        interactive_login_manager.cleanup_client(user_id),
+        store_user_session(user_id, result['session_string'], logged_in_user_info),
+    )
+
+    if not session_stored:
+        logger.error(f"Failed to store session for user {user_id}")
+        return _err('store_failed')
+    return None
+
+async def _finish_login(user_id: int, result: dict) -> web.Response:
+    """Shared success path of the code and 2FA password submissions."""
+    # Shielded: once Telegram has logged the user in, a cancelled request
+    # must not leave the session half stored or the login client connected
+    error_response = await asyncio.shield(_commit_login(user_id, result))
+    if error_response is not None:
+        return error_response
+
+    # Notify user via bot DM (non-blocking best-effort)
+    try:
+        _notify_queue.put_nowait((user_id, result['user_info']))
+    except asyncio.QueueFull:
+        logger.warning(f"Session notification queue full, skipping DM for user {user_id}")
+
+    # Prepare redirect response with session token for the frontend and set cookies
+    session_token = await generate_session_token(user_id)
+    response = _json_response({
+        'status': 'success',
+        'redirect_url': '/session/success',
+        'session_token': session_token
+    })
+    try:
+        set_auth_cookies(response, session_token, user_id)
+    except Exception:
+        pass
+    return response
 
 @routes.post("/session/submit_code")
 async def session_submit_code_route(request: web.Request):
     """Handle verification code submission."""
-    data = await request.json()
+    data = await _read_json(request)
     token = data.get('token')
     phone_number = data.get('phone_number')
     phone_code_hash = data.get('phone_code_hash')
@@ -764,7 +1078,7 @@ async def session_submit_code_route(request: web.Request):
 
     user_id = await validate_session_token(token)
     if not user_id:
-        return web.json_response({'status': 'error', 'message': 'Invalid or expired session.'}, status=401)
+        return _err('invalid_session')
 
     try:
         result = await asyncio.wait_for(
@@ -776,62 +1090,23 @@ async def session_submit_code_route(request: web.Request):
             await interactive_login_manager.cleanup_client(user_id)
         except Exception:
             pass
-        return web.json_response({'status': 'timeout', 'message': 'Verification timed out. Please request a new code.'}, status=504)
+        return _err('code_timeout')
 
     if result.get('status') == 'success':
-        # SECURITY: Verify that the logged-in user matches the widget user
-        logged_in_user_info = result.get('user_info')
-        if not logged_in_user_info or logged_in_user_info.get('id') != user_id:
-            await interactive_login_manager.cleanup_client(user_id)
-            return web.json_response({
-                'status': 'error', 
-                'message': 'Account mismatch. The logged-in account does not match the widget account.'
-            }, status=400)
-
-        # Store the session and clean up
-        from StreamBot.database.user_sessions import store_user_session
-        session_stored = await store_user_session(user_id, result['session_string'], logged_in_user_info)
-        await interactive_login_manager.cleanup_client(user_id)
-
-        if not session_stored:
-            logger.error(f"Failed to store session for user {user_id}")
-            return web.json_response({
-                'status': 'error', 
-                'message': 'Failed to store session. Please try again.'
-            }, status=500)
-
-        # Notify user via bot DM (non-blocking best-effort)
-        try:
-            from StreamBot.session_generator.session_manager import session_manager
-            asyncio.create_task(session_manager.notify_bot_about_new_session(user_id, logged_in_user_info))
-        except Exception as _e:
-            logger.debug(f"Notify bot about new session failed for {user_id}: {_e}")
-
-        # Prepare redirect response with session token for the frontend and set cookies
-        session_token = generate_session_token(user_id)
-        response = web.json_response({
-            'status': 'success',
-            'redirect_url': '/session/success',
-            'session_token': session_token
-        })
-        try:
-            set_auth_cookies(response, session_token, user_id)
-        except Exception:
-            pass
-        return response
+        return await _finish_login(user_id, result)
 
-    return web.json_response(result)
+    return _json_response(result)
 
 @routes.post("/session/submit_password")
 async def session_submit_password_route(request: web.Request):
     """Handle 2FA password submission."""
-    data = await request.json()
+    data = await _read_json(request)
     token = data.get('token')
     password = data.get('password')
 
     user_id = await validate_session_token(token)
     if not user_id:
-        return web.json_response({'status': 'error', 'message': 'Invalid or expired session.'}, status=401)
+        return _err('invalid_session')
 
 
     try:
@@ -844,81 +1119,33 @@ async def session_submit_password_route(request: web.Request):
             await interactive_login_manager.cleanup_client(user_id)
         except Exception:
             pass
-        return web.json_response({'status': 'timeout', 'message': '2FA verification timed out. Please request a new code.'}, status=504)
+        return _err('password_timeout')
 
     if result.get('status') == 'success':
-        # SECURITY: Verify that the logged-in user matches the widget user
-        logged_in_user_info = result.get('user_info')
-        if not logged_in_user_info or logged_in_user_info.get('id') != user_id:
-            await interactive_login_manager.cleanup_client(user_id)
-            return web.json_response({
-                'status': 'error', 
-                'message': 'Account mismatch. The logged-in account does not match the widget account.'
-            }, status=400)
-
-        from StreamBot.database.user_sessions import store_user_session
-        session_stored = await store_user_session(user_id, result['session_string'], logged_in_user_info)
-        await interactive_login_manager.cleanup_client(user_id)
+        return await _finish_login(user_id, result)
 
-        if not session_stored:
-            logger.error(f"Failed to store session for user {user_id}")
-            return web.json_response({
-                'status': 'error', 
-                'message': 'Failed to store session. Please try again.'
-            }, status=500)
-
-        # Notify user via bot DM (non-blocking best-effort)
-        try:
-            from StreamBot.session_generator.session_manager import session_manager
-            asyncio.create_task(session_manager.notify_bot_about_new_session(user_id, logged_in_user_info))
-        except Exception as _e:
-            logger.debug(f"Notify bot about new session failed for {user_id}: {_e}")
-
-        # Prepare redirect response with session token for the frontend and set cookies
-        session_token = generate_session_token(user_id)
-        response = web.json_response({
-            'status': 'success',
-            'redirect_url': '/session/success',
-            'session_token': session_token
-        })
-        try:
-            set_auth_cookies(response, session_token, user_id)
-        except Exception:
-            pass
-        return response
-
-    return web.json_response(result)
+    return _json_response(result)
 
 @routes.post("/session/auth")
 async def session_auth_route(request: web.Request):
     """Handle Telegram authentication and redirect to interactive login."""
     try:
-        data = await request.json()
-
-        # Verify Telegram authentication
-        from StreamBot.session_generator.telegram_auth import TelegramAuth
-        telegram_auth = TelegramAuth()
+        data = await _read_json(request)
 
+        # Verify Telegram authentication with the shared verifier
         if not telegram_auth.verify_telegram_auth(data):
-            return web.json_response({
-                'success': False,
-                'error': 'Invalid Telegram authentication'
-            }, status=400)
+            return _err('invalid_telegram_auth')
 
         user_id = int(data['id'])
 
         # Check if user has permission to use session generator
         if not check_session_generator_access(user_id):
             logger.info(f"Session generator web access denied for non-admin user {user_id}")
-            return web.json_response({
-                'success': False,
-                'error': 'Access to the session generator is restricted to administrators.'
-            }, status=403)
+            return _err('access_restricted')
 
-        from StreamBot.database.user_sessions import check_user_has_session
         if await check_user_has_session(user_id):
-            session_token = generate_session_token(user_id)
-            response = web.json_response({
+            session_token = await generate_session_token(user_id)
+            response = _json_response({
                 'success': True,
                 'redirect_url': '/session/success',
                 'session_token': session_token
@@ -927,9 +1154,9 @@ async def session_auth_route(request: web.Request):
             return response
 
         # Generate a temporary token and redirect to the login form
-        session_token = generate_session_token(user_id)
+        session_token = await generate_session_token(user_id)
 
-        return web.json_response({
+        return _json_response({
             'success': True,
             'redirect_url': f'/session/login?token={session_token}',
             'session_token': session_token
@@ -937,36 +1164,26 @@ async def session_auth_route(request: web.Request):
 
     except Exception as e:
         logger.error(f"Error in session auth route: {e}", exc_info=True)
-        return web.json_response({
-            'success': False,
-            'error': 'An internal server error occurred.'
-        }, status=500)
+        return _err('auth_failed')
 
 @routes.get("/session/success")
 async def session_success_route(request: web.Request):
     """Session generation success page route."""
-    from aiohttp_jinja2 import render_template
-    from StreamBot.database.user_sessions import get_user_session_info
 
     try:
         # Prefer cookie/header session token
-        session_token = get_session_token(request)
-        user_id = await validate_session_token(session_token) if session_token else None
+        user_id, user_session_info = await _resolve_authenticated_user(request)
 
         if not user_id:
             logger.warning("No valid session token or user_id provided for success page")
             return web.HTTPFound('/session')
 
-        # Get user session info from database
-        user_session_info = await get_user_session_info(user_id)
         if not user_session_info:
             logger.warning(f"No session info found for user {user_id} on success page")
             return web.HTTPFound('/session')
 
         user_profile = user_session_info.get('user_info', {})
-        # Generate deterministic identicon avatar (DiceBear) using SHA-256 seed
-        avatar_seed = hashlib.sha256(str(user_id).encode('utf-8')).hexdigest()
-        avatar_url = f"https://api.dicebear.com/7.x/identicon/svg?seed={avatar_seed}&size=128"
+        avatar_url = _avatar_url_for(user_id)
 
         # Get bot username for the success page
         bot_client = request.app['bot_client']
@@ -989,7 +1206,6 @@ async def session_success_route(request: web.Request):
 @routes.get("/session/dashboard")
 async def session_dashboard_route(request: web.Request):
     """Session generator dashboard for authenticated users with proper session management."""
-    from aiohttp_jinja2 import render_template
 
     # Check for session token in cookies or headers, fallback to query parameter
     session_token = get_session_token(request)
@@ -1018,7 +1234,6 @@ async def session_dashboard_route(request: web.Request):
             )
 
         # Get user session info
-        from StreamBot.database.user_sessions import get_user_session_info
         user_session_info = await get_user_session_info(user_id)
 
         if not user_session_info:
@@ -1026,12 +1241,10 @@ async def session_dashboard_route(request: web.Request):
             return web.HTTPFound('/session')
 
         user_profile = user_session_info.get('user_info', {})
-        # Generate deterministic identicon avatar (DiceBear) using SHA-256 seed
-        avatar_seed = hashlib.sha256(str(user_id).encode('utf-8')).hexdigest()
-        avatar_url = f"https://api.dicebear.com/7.x/identicon/svg?seed={avatar_seed}&size=128"
+        avatar_url = _avatar_url_for(user_id)
 
         # Generate new session token for this session
-        new_session_token = generate_session_token(user_id)
+        new_session_token = await generate_session_token(user_id)
 
         bot_client: Client = request.app.get('bot_client')
         bot_username = getattr(bot_client.me, 'username', None) if bot_client and hasattr(bot_client, 'me') else None
@@ -1048,20 +1261,7 @@ async def session_dashboard_route(request: web.Request):
         response = render_template('session_complete.html', request, context)
 
         # Set session cookie for proper session management
-        if hasattr(response, 'set_cookie'):
-            is_secure = str(Var.BASE_URL).lower().startswith('https://')
-            response.set_cookie('session_token', new_session_token, httponly=True, secure=is_secure, max_age=3600, samesite='Lax')
-            # convenience cookies for UI
-            response.set_cookie('is_authenticated', 'true', httponly=True, secure=is_secure, max_age=3600, samesite='Lax')
-            response.set_cookie('user_id', str(user_id), httponly=True, secure=is_secure, max_age=3600, samesite='Lax')
-        else:
-            # If render_template doesn't return a response object, create one
-            response = web.Response(text=response, content_type='text/html')
-            is_secure = str(Var.BASE_URL).lower().startswith('https://')
-            response.set_cookie('session_token', new_session_token, httponly=True, secure=is_secure, max_age=3600, samesite='Lax')
-            response.set_cookie('is_authenticated', 'true', httponly=True, secure=is_secure, max_age=3600, samesite='Lax')
-            response.set_cookie('user_id', str(user_id), httponly=True, secure=is_secure, max_age=3600, samesite='Lax')
-
+        set_auth_cookies(response, new_session_token, user_id)
         return response
 
     except (ValueError, TypeError):
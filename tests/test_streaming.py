@@ -0,0 +1,233 @@
+import asyncio
+import importlib.util
+import os
+import unittest
+
+# StreamBot.config reads these at import time and exits when they are missing
+os.environ.setdefault("API_ID", "12345")
+os.environ.setdefault("API_HASH", "0" * 32)
+os.environ.setdefault("BOT_TOKEN", "123456789:" + "A" * 35)
+os.environ.setdefault("LOG_CHANNEL", "-1001234567890")
+os.environ.setdefault("BASE_URL", "http://localhost:8080")
+os.environ.setdefault("DATABASE_URL", "mongodb://localhost:27017")
+
+HAS_DEPS = all(importlib.util.find_spec(name) for name in ("aiohttp", "pyrogram", "pymongo"))
+
+if HAS_DEPS:
+    from StreamBot.web import streaming
+
+
+class FakeStreamClient:
+    """Stands in for a pyrogram Client; records when stream_media's generator is closed."""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.upstream_closed = False
+
+    def stream_media(self, media_msg, offset=0, limit=0):
+        async def generator():
+            try:
+                for part in self.parts[offset:offset + limit]:
+                    yield part
+            finally:
+                self.upstream_closed = True
+        return generator()
+
+
+class FakeTransport:
+    def __init__(self, on_abort):
+        self.aborted = False
+        self._on_abort = on_abort
+
+    def abort(self):
+        self.aborted = True
+        self._on_abort()
+
+
+class StalledResponse:
+    """A response whose write blocks until the transport is aborted, like a full socket buffer."""
+
+    def __init__(self):
+        self.released = asyncio.Event()
+        self.transport = FakeTransport(self.released.set)
+
+    async def write(self, data):
+        await self.released.wait()
+
+
+class BlockingSource:
+    """An async iterator that yields its parts and then blocks until closed."""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.closed = False
+
+    def __aiter__(self):
+        return self._generator()
+
+    async def _generator(self):
+        try:
+            for part in self.parts:
+                yield part
+            await asyncio.Event().wait()
+        finally:
+            self.closed = True
+
+
+class SourceStopped(BaseException):
+    pass
+
+
+class FailingSource:
+    """An async iterator over `parts` whose end or aclose() raises."""
+
+    def __init__(self, parts, end_error=None, close_error=None):
+        self.parts = iter(parts)
+        self.end_error = end_error
+        self.close_error = close_error
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        for part in self.parts:
+            return part
+        if self.end_error is not None:
+            raise self.end_error
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        if self.close_error is not None:
+            raise self.close_error
+
+
+@unittest.skipUnless(HAS_DEPS, "aiohttp, pyrogram and pymongo are required")
+class PrefetchTerminationTests(unittest.IsolatedAsyncioTestCase):
+    async def _drain(self, source):
+        received = []
+
+        async def consume():
+            async for item in streaming._prefetched(source, depth=1):
+                received.append(item)
+
+        return received, asyncio.wait_for(consume(), timeout=1)
+
+    async def test_aclose_error_after_last_item_reaches_consumer(self):
+        received, drained = await self._drain(FailingSource([b"a", b"b"], close_error=RuntimeError("close")))
+
+        with self.assertRaisesRegex(RuntimeError, "close"):
+            await drained
+        self.assertEqual(received, [b"a", b"b"])
+
+    async def test_base_exception_from_source_reaches_consumer(self):
+        received, drained = await self._drain(FailingSource([b"a"], end_error=SourceStopped()))
+
+        with self.assertRaises(SourceStopped):
+            await drained
+        self.assertEqual(received, [b"a"])
+
+
+@unittest.skipUnless(HAS_DEPS, "aiohttp, pyrogram and pymongo are required")
+class PrefetchCancellationTests(unittest.IsolatedAsyncioTestCase):
+    async def _cancel_handler(self, stream, settle):
+        started = asyncio.Event()
+
+        async def handler():
+            try:
+                await anext(stream)
+                started.set()
+                try:
+                    await asyncio.sleep(60)
+                except asyncio.CancelledError:
+                    pass  # Swallowed further down, as aiohttp internals may do
+                return "returned"
+            finally:
+                await stream.aclose()
+
+        task = asyncio.create_task(handler())
+        await started.wait()
+        await settle()
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+    async def test_cancelled_while_producer_running(self):
+        source = BlockingSource([b"a", b"b"])
+        stream = streaming._prefetched(aiter(source), depth=4)
+
+        await self._cancel_handler(stream, lambda: asyncio.sleep(0))
+
+        self.assertTrue(source.closed)
+
+    async def test_cancelled_after_producer_finished(self):
+        async def source():
+            yield b"a"
+
+        stream = streaming._prefetched(source(), depth=4)
+
+        async def settle():
+            for _ in range(5):
+                await asyncio.sleep(0)
+
+        await self._cancel_handler(stream, settle)
+
+
+@unittest.skipUnless(HAS_DEPS, "aiohttp, pyrogram and pymongo are required")
+class WriteWatchdogTests(unittest.IsolatedAsyncioTestCase):
+    async def test_stall_aborts_transport_without_cancelling_task(self):
+        response = StalledResponse()
+        watchdog = streaming._WriteWatchdog(1, response.transport, timeout=0.05)
+        try:
+            ok = await streaming._write_buffer(response, bytearray(b"data"), watchdog, "127.0.0.1")
+        finally:
+            watchdog.close()
+
+        self.assertFalse(ok)
+        self.assertTrue(watchdog.stalled)
+        self.assertTrue(response.transport.aborted)
+        self.assertEqual(asyncio.current_task().cancelling(), 0)
+
+    async def test_write_buffer_propagates_cancellation(self):
+        response = StalledResponse()
+        watchdog = streaming._WriteWatchdog(1, response.transport, timeout=60)
+
+        async def writer():
+            try:
+                return await streaming._write_buffer(response, bytearray(b"data"), watchdog, "127.0.0.1")
+            finally:
+                watchdog.close()
+
+        task = asyncio.create_task(writer())
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+
+@unittest.skipUnless(HAS_DEPS, "aiohttp, pyrogram and pymongo are required")
+class CachedPartsTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        streaming._PART_CACHE.clear()
+        streaming._part_cache_bytes = 0
+
+    async def test_early_close_closes_upstream(self):
+        client = FakeStreamClient([b"a", b"b", b"c"])
+        parts = streaming._cached_parts(client, None, 1, 0, 3, 2)
+
+        self.assertEqual(await anext(parts), b"a")
+        await parts.aclose()
+
+        self.assertTrue(client.upstream_closed)
+
+    async def test_early_close_through_prefetch_closes_upstream(self):
+        client = FakeStreamClient([b"a", b"b", b"c", b"d", b"e", b"f"])
+        stream = streaming._prefetched(streaming._cached_parts(client, None, 2, 0, 6, 5), depth=1)
+
+        self.assertEqual(await anext(stream), b"a")
+        await stream.aclose()
+
+        self.assertTrue(client.upstream_closed)
+
+
+if __name__ == "__main__":
+    unittest.main()